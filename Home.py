@@ -1,7 +1,10 @@
 import streamlit as st
 import leafmap.foliumap as leafmap
 
+from common import assets, timing
+
 st.set_page_config(layout="wide")
+timing.page('Home')
 
 # Customize the sidebar
 markdown = """
@@ -12,7 +15,7 @@ GitHub Repository: <https://github.com/kman2022/streamlit-multipage-template>
 st.sidebar.title("About")
 st.sidebar.info(markdown)
 logo = "https://i.imgur.com/UbOXYAU.png"
-st.sidebar.image(logo)
+assets.image(st.sidebar, assets.bundled(logo))
 
 # Customize page title
 st.title("Streamlit for Geospatial Applications")
@@ -35,6 +38,10 @@ markdown = """
 
 st.markdown(markdown)
 
-m = leafmap.Map(minimap_control=True)
-m.add_basemap("OpenTopoMap")
-m.to_streamlit(height=500)
\ No newline at end of file
+with timing.stage('build_map'):
+    m = leafmap.Map(minimap_control=True)
+    m.add_basemap("OpenTopoMap")
+with timing.stage('to_streamlit'):
+    m.to_streamlit(height=500)
+
+timing.panel()
\ No newline at end of file
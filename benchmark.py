@@ -0,0 +1,232 @@
+"""headless page benchmarks against scaled copies of the local data store
+
+    python benchmark.py                                  # every page at 1x, 10x and 100x
+    python benchmark.py --scales 1 10 --pages pjm miso   # a subset
+    python benchmark.py --json bench.json                # also write the raw results
+    python benchmark.py --synthetic --scales 1 10 100    # generated data, no warmed store needed
+
+Fixtures are built from the warmed store (python build_data.py warmup) by repeating
+every queue and cost row `scale` times into a temporary IQ_DATA_DIR; boundary layers
+are copied as they are. With --synthetic they are generated at that scale instead
+(common/synthetic.py). Each page then runs in its own process through streamlit's
+AppTest with IQ_OFFLINE=1, and reports
+    cold     first run of the script, including imports and cache fills
+    rerun    median time of a rerun after changing one widget (every widget is tried once)
+    rss      peak resident memory of the process
+    payload  serialized size of the elements the run emitted
+"""
+import argparse
+import json
+import os
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+
+PAGES = {
+    'home': 'Home.py',
+    'queued_up': 'pages/1_⚡_Queued_Up.py',
+    'queued_up_map': 'pages/2_⚡_Queued_Up_Map.py',
+    'pjm': 'pages/3_🔥_PJM_Heatmap.py',
+    'miso': 'pages/4_🔥_MISO_Heatmap.py',
+    'nyiso': 'pages/5_🔥_NYISO_Heatmap.py',
+}
+
+# sources whose rows grow with the queue; the rest are boundaries and lines
+SCALED_SOURCES = ['trend', 'trend_dur', 'qmap', 'pjm_cost', 'miso_cost', 'nyiso_cost']
+
+TIMEOUT = 600
+
+
+def _env(data_dir):
+    env = dict(os.environ, IQ_DATA_DIR=str(data_dir), IQ_OFFLINE='1')
+    env.pop('IQ_TIMING_LOG', None)
+    env.pop('IQ_METRICS_PORT', None)
+    return env
+
+
+def _child(*args, data_dir):
+    out = subprocess.run([sys.executable, __file__, *args], env=_env(data_dir), cwd=ROOT,
+                         capture_output=True, text=True)
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip().splitlines()[-1] if out.stderr.strip() else 'failed')
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _build_derived():
+    from common import layers, qmap_data
+
+    qmap_data.build_shards(force=True)
+    for name in layers.LAYERS:
+        layers.build_tiers(name, force=True)
+
+
+def prepare_synthetic(scale):
+    """generate a store of scale times the published row counts into IQ_DATA_DIR"""
+    from common import store, synthetic
+
+    synthetic.generate(scale=scale)
+    _build_derived()
+    return {'data_dir': str(store.DATA_DIR)}
+
+
+def prepare(source_dir, scale):
+    """copy the store into IQ_DATA_DIR with every queue and cost table repeated scale times"""
+    import geopandas as gpd
+    import pandas as pd
+
+    from common import store
+
+    for name in list(store.SOURCES) + list(store.GEO_SOURCES):
+        src = Path(source_dir) / f'{name}.parquet'
+        if not src.exists():
+            raise SystemExit(f'{src} missing; run `python build_data.py warmup` first')
+        meta = json.loads((Path(source_dir) / f'{name}.meta.json').read_text())
+        if name in SCALED_SOURCES and scale > 1:
+            df = pd.read_parquet(src) if name in store.SOURCES else gpd.read_parquet(src)
+            df = pd.concat([df] * scale, ignore_index=True)
+            with store.atomic_target(store.local_path(name)) as tmp:
+                df.to_parquet(tmp, index=False)
+        else:
+            store.DATA_DIR.mkdir(parents=True, exist_ok=True)
+            shutil.copyfile(src, store.local_path(name))
+        meta.update(version=f"{meta.get('version', name)}x{scale}", checked_at=time.time())
+        store.meta_path(name).write_text(json.dumps(meta))
+    _build_derived()
+    return {'data_dir': str(store.DATA_DIR)}
+
+
+def _payload(node):
+    # bytes of every element and block proto under node
+    size = 0
+    proto = getattr(node, 'proto', None)
+    if proto is not None and hasattr(proto, 'ByteSize'):
+        size += proto.ByteSize()
+    for child in getattr(node, 'children', {}).values():
+        size += _payload(child)
+    return size
+
+
+def _changes(at):
+    # one (label, change) per widget, each moving it off its current value
+    changes = []
+    for i, w in enumerate(at.selectbox):
+        if len(w.options) > 1:
+            changes.append((f'selectbox:{w.label}', lambda at, i=i: at.selectbox[i].select_index(
+                (at.selectbox[i].index + 1) % len(at.selectbox[i].options))))
+    for i, w in enumerate(at.slider):
+        changes.append((f'slider:{w.label}', lambda at, i=i: at.slider[i].set_value(
+            at.slider[i].value - at.slider[i].step if at.slider[i].value > at.slider[i].min
+            else at.slider[i].value + at.slider[i].step)))
+    for i, w in enumerate(at.checkbox):
+        changes.append((f'checkbox:{w.label}', lambda at, i=i: at.checkbox[i].set_value(not at.checkbox[i].value)))
+    for i, w in enumerate(at.multiselect):
+        changes.append((f'multiselect:{w.label}', lambda at, i=i: at.multiselect[i].unselect(at.multiselect[i].value[0])
+                        if at.multiselect[i].value else at.multiselect[i].select(at.multiselect[i].options[0])))
+    return changes
+
+
+def run_page(page):
+    """one cold run and one rerun per widget change of a page, in this process"""
+    from streamlit.testing.v1 import AppTest
+
+    at = AppTest.from_file(str(ROOT / PAGES[page]), default_timeout=TIMEOUT)
+    start = time.perf_counter()
+    at.run()
+    cold = time.perf_counter() - start
+    errors = [e.message for e in at.exception]
+    payload = _payload(at._tree)
+
+    reruns = {}
+    for label, change in _changes(at):
+        try:
+            change(at)
+        except (IndexError, ValueError):
+            # the widget list changed shape after an earlier rerun
+            continue
+        start = time.perf_counter()
+        at.run()
+        reruns[label] = time.perf_counter() - start
+        errors += [e.message for e in at.exception]
+
+    return {'page': page, 'cold_s': cold, 'reruns_s': reruns,
+            'rerun_median_s': statistics.median(reruns.values()) if reruns else None,
+            # ru_maxrss is in KiB on Linux
+            'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+            'payload_bytes': payload, 'errors': errors}
+
+
+def _fmt(value, spec):
+    return '-' if value is None else format(value, spec)
+
+
+def report(results):
+    lines = [f"{'page':<15}{'scale':>6}{'cold s':>9}{'rerun s':>9}{'rss MB':>9}{'payload KB':>12}  errors"]
+    for r in results:
+        if 'failed' in r:
+            lines.append(f"{r['page']:<15}{r['scale']:>5}x  failed: {r['failed']}")
+            continue
+        lines.append(f"{r['page']:<15}{r['scale']:>5}x{_fmt(r['cold_s'], '9.2f')}{_fmt(r['rerun_median_s'], '9.3f')}"
+                     f"{_fmt(r['peak_rss_mb'], '9.0f')}{_fmt(r['payload_bytes'] / 1024, '12.1f')}  {len(r['errors'])}")
+    return '\n'.join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--pages', nargs='+', choices=list(PAGES), default=list(PAGES))
+    parser.add_argument('--source', default=None, help='warmed data store to scale (default: the app\'s own)')
+    parser.add_argument('--json', help='write the raw results here')
+    parser.add_argument('--keep', action='store_true', help='keep the fixture directories')
+    parser.add_argument('--synthetic', action='store_true', help='generate the fixtures instead of scaling the store')
+    # internal: the steps that must run in a fresh process with IQ_DATA_DIR set
+    parser.add_argument('--prepare', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--run', choices=list(PAGES), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.prepare is not None:
+        print(json.dumps(prepare_synthetic(args.prepare) if args.synthetic else prepare(args.source, args.prepare)))
+        return
+    if args.run:
+        print(json.dumps(run_page(args.run)))
+        return
+
+    if args.source is None:
+        from common import store
+        args.source = str(store.DATA_DIR)
+
+    results = []
+    for scale in args.scales:
+        fixture = Path(tempfile.mkdtemp(prefix=f'iq-bench-{scale}x-'))
+        try:
+            prepare_args = ['--synthetic'] if args.synthetic else ['--source', args.source]
+            _child('--prepare', str(scale), *prepare_args, data_dir=fixture)
+            for page in args.pages:
+                try:
+                    result = _child('--run', page, data_dir=fixture)
+                except RuntimeError as e:
+                    result = {'page': page, 'failed': str(e)}
+                result['scale'] = scale
+                results.append(result)
+                print(report([result]).splitlines()[1], flush=True)
+        finally:
+            if args.keep:
+                print(f'fixture kept at {fixture}')
+            else:
+                shutil.rmtree(fixture, ignore_errors=True)
+
+    print()
+    print(report(results))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
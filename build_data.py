@@ -0,0 +1,60 @@
+"""build the local data store ahead of deploy
+
+    python build_data.py warmup     # fetch every source and build the derived files, concurrently
+    python build_data.py refresh    # re-check every upstream source, fetching only what changed
+    python build_data.py shards     # one GeoParquet file per region for the queue map
+    python build_data.py layers     # simplified GeoJSON tiers of the boundary/transmission layers
+    python build_data.py tiles      # PMTiles for IQ_VECTOR_TILES=1 (needs tippecanoe)
+    python build_data.py assets     # fingerprinted copies of every linked image under static/assets
+    python build_data.py synthetic --scale 10              # generated stand-ins for every source
+    python build_data.py synthetic --rows 500000 --regions PJM=0.6 MISO=0.4 --seed 1
+"""
+import argparse
+import time
+
+from common import assets, layers, qmap_data, store, synthetic, tiles, warmup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('step', choices=['warmup', 'refresh', 'shards', 'layers', 'tiles', 'assets', 'synthetic'])
+    synth = parser.add_argument_group('synthetic')
+    synth.add_argument('--rows', type=int, help='queue requests to generate (default: scale x the published count)')
+    synth.add_argument('--scale', type=float, default=1.0)
+    synth.add_argument('--regions', nargs='+', metavar='REGION=SHARE', help='region mix (default: LBNL-like)')
+    synth.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.step == 'warmup':
+        start = time.perf_counter()
+        failed = warmup.warmup()
+        print(f'warmup: done in {time.perf_counter() - start:.1f}s, {len(failed)} failed')
+    elif args.step == 'refresh':
+        for name in list(store.SOURCES) + list(store.GEO_SOURCES):
+            changed = store.refresh(name)
+            print(f"{name}: {'updated' if changed else 'unchanged'} ({store.version(name)})")
+    elif args.step == 'shards':
+        qmap_data.build_shards(force=True)
+    elif args.step == 'layers':
+        for name in layers.LAYERS:
+            layers.build_tiers(name, force=True)
+    elif args.step == 'tiles':
+        for name in tiles.TILE_LAYERS:
+            tiles.build_tiles(name)
+    elif args.step == 'synthetic':
+        mix = None
+        if args.regions:
+            mix = {region: float(share) for region, share in (r.rsplit('=', 1) for r in args.regions)}
+            unknown = set(mix) - set(synthetic.REGION_BOUNDS)
+            if unknown:
+                parser.error(f"unknown regions {sorted(unknown)}; choose from {list(synthetic.REGION_BOUNDS)}")
+        written = synthetic.generate(rows=args.rows, scale=args.scale, region_mix=mix, seed=args.seed)
+        for name, rows in written.items():
+            print(f'{name}: {rows} rows ({store.version(name)})')
+    elif args.step == 'assets':
+        for url, name in assets.vendor().items():
+            print(f'{name} <- {url}')
+
+
+if __name__ == '__main__':
+    main()
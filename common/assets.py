@@ -0,0 +1,151 @@
+import asyncio
+import hashlib
+import json
+import re
+from pathlib import Path, PurePosixPath
+from urllib.parse import urlparse
+
+import requests
+import streamlit as st
+from requests.adapters import HTTPAdapter
+
+from common import store
+
+# remote images kept on local disk, fetched together with a page's data sources
+ASSET_DIR = store.DATA_DIR / 'assets'
+POOL_SIZE = 16
+
+# Vendored bundle: every image the app links to, written once by `build_data.py assets`
+# under static/ with a content hash in the name. Pages point the browser at
+# /app/static/assets/<name>?v=<hash>. The tornado server of the streamlit pinned in
+# requirements.txt answers versioned static urls with a ten year Cache-Control and
+# gzips svg on the fly; the starlette server of later releases sends neither.
+STATIC_DIR = Path(__file__).resolve().parent.parent / 'static'
+BUNDLE_DIR = STATIC_DIR / 'assets'
+BUNDLE_MANIFEST = BUNDLE_DIR / 'manifest.json'
+STATIC_URL = '/app/static/assets'
+
+GITHUB_BERKLEY = 'https://github.com/kman2022/data/blob/main/main/berkley/'
+ASSET_URLS = [
+    'https://i.imgur.com/UbOXYAU.png',
+    'https://emp.lbl.gov/sites/all/files/logo.png',
+    'https://elibrary.ferc.gov/eLibrary/assets/img/FERC-banner.png',
+    'https://raw.githubusercontent.com/kman2022/data/main/main/berkley/power_pic.jpeg',
+    GITHUB_BERKLEY + 'IQ_study_process_small%20copy.png?raw=true',
+    GITHUB_BERKLEY + 'transmission.png?raw=true',
+    'https://www.pjm.com/assets/responsive/img/pjm-logo.png',
+    'https://www.misoenergy.org/client/dist/img/logo.png',
+    'https://www.nyiso.com/o/nyiso-main-theme/images/logo.svg',
+]
+
+
+@st.cache_resource
+def _session():
+    # one pooled session per process; keep-alive connections are reused across pages
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def asset_path(url):
+    suffix = PurePosixPath(urlparse(url).path).suffix
+    return ASSET_DIR / (hashlib.sha1(url.encode()).hexdigest()[:16] + suffix)
+
+
+def _download(url):
+    path = asset_path(url)
+    if not path.exists():
+        resp = _session().get(url, timeout=30)
+        resp.raise_for_status()
+        with store.atomic_target(path) as tmp:
+            with open(tmp, 'wb') as f:
+                f.write(resp.content)
+    return str(path)
+
+
+def vendor(urls=ASSET_URLS):
+    """copy every linked image into the static bundle under a fingerprinted name"""
+    manifest = {}
+    for url in urls:
+        resp = _session().get(url, timeout=30)
+        resp.raise_for_status()
+        digest = hashlib.sha256(resp.content).hexdigest()[:12]
+        stem = PurePosixPath(urlparse(url).path)
+        name = f"{re.sub(r'[^A-Za-z0-9]+', '_', stem.stem).strip('_')}.{digest}{stem.suffix}"
+        path = BUNDLE_DIR / name
+        if not path.exists():
+            with store.atomic_target(path) as tmp:
+                with open(tmp, 'wb') as f:
+                    f.write(resp.content)
+        manifest[url] = name
+    # written last: a url is only served from the bundle once its file is in place
+    with store.atomic_target(BUNDLE_MANIFEST) as tmp:
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=1)
+    return manifest
+
+
+@st.cache_resource
+def _bundle():
+    try:
+        with open(BUNDLE_MANIFEST) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def bundled(url):
+    """local path of url in the static bundle, or url itself when it was not vendored"""
+    name = _bundle().get(url)
+    return str(BUNDLE_DIR / name) if name else url
+
+
+def image(container, src, width=None, caption=None):
+    """st.image for a fetched or bundled image
+
+    A bundled file is shown by its fingerprinted static url so the browser keeps it
+    across page views; anything else goes through st.image as before.
+    """
+    path = Path(src)
+    if path.parent == BUNDLE_DIR and st.get_option('server.enableStaticServing'):
+        digest = path.stem.rsplit('.', 1)[-1]
+        size = f' width="{width}"' if width else ' style="max-width:100%"'
+        container.markdown(f'<img src="{STATIC_URL}/{path.name}?v={digest}"{size}>',
+                           unsafe_allow_html=True)
+        if caption:
+            container.caption(caption)
+    else:
+        # newer streamlit rejects width=None; leave it out unless one was given
+        kwargs = {'width': width} if width else {}
+        container.image(src, caption=caption, **kwargs)
+
+
+async def _fetch_all(urls, sources):
+    # downloads and store syncs are blocking; run them side by side on worker threads
+    images = [asyncio.to_thread(_download, url) for url in urls]
+    data = [asyncio.to_thread(store.sync, name) for name in sources]
+    results = await asyncio.gather(*images, *data, return_exceptions=True)
+    for result in results[len(urls):]:
+        if isinstance(result, Exception):
+            raise result
+    return results[:len(urls)]
+
+
+@st.cache_resource
+def fetch(urls, sources=()):
+    """fetch a page's remote inputs in parallel
+
+    Returns {url: local path} for the images, for assets.image. Bundled images are
+    never downloaded; any other image that could not be fetched, or that st.image
+    cannot read from disk (svg), maps back to its url so the browser loads it as
+    before. Data sources land in the local store.
+    """
+    local = {url: bundled(url) for url in urls}
+    missing = () if store.OFFLINE else tuple(url for url in urls if local[url] == url)
+    paths = asyncio.run(_fetch_all(missing, sources))
+    for url, path in zip(missing, paths):
+        if not isinstance(path, Exception) and not path.endswith('.svg'):
+            local[url] = path
+    return local
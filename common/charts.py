@@ -0,0 +1,22 @@
+import altair as alt
+
+from common.cost_data import COST_COLUMNS
+
+
+def box_chart(stats, outliers, title='Costs per kW'):
+    """box plot of precomputed stats (see cost_data.box_stats)
+
+    Sent as a small vega-lite spec the browser draws, instead of a matplotlib
+    figure rasterized on every rerun.
+    """
+    x = alt.X('cost:N', sort=COST_COLUMNS, title=None, axis=alt.Axis(labelAngle=0))
+    base = alt.Chart(stats).encode(
+        x=x,
+        tooltip=['cost', 'n', alt.Tooltip('lower:Q', format=',.0f'), alt.Tooltip('q1:Q', format=',.0f'),
+                 alt.Tooltip('median:Q', format=',.0f'), alt.Tooltip('q3:Q', format=',.0f'),
+                 alt.Tooltip('upper:Q', format=',.0f')])
+    whiskers = base.mark_rule().encode(y=alt.Y('lower:Q', title=title), y2='upper:Q')
+    boxes = base.mark_bar(size=40).encode(y='q1:Q', y2='q3:Q')
+    medians = base.mark_tick(color='white', size=40, thickness=2).encode(y='median:Q')
+    points = alt.Chart(outliers).mark_point(shape='cross').encode(x=x, y='value:Q')
+    return alt.layer(whiskers, boxes, medians, points)
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from common import store
+
+# normalized cost columns shared by every ISO sample (see store.GEO_SOURCES)
+COST_COLUMNS = ['poi_cost/kw', 'network_cost/kw', 'total_cost/kw']
+PARTITION_KEYS = ['q_year', 'fuel', 'request_status']
+# whisker reach in interquartile ranges, as matplotlib's boxplot(whis=1.5)
+WHIS = 1.5
+BOX_COLUMNS = ['cost', 'n', 'q1', 'median', 'q3', 'lower', 'upper']
+
+ISO_SOURCES = {
+    'PJM': {'cost': 'pjm_cost', 'iso': 'pjm_iso'},
+    'MISO': {'cost': 'miso_cost', 'iso': 'miso_iso'},
+    'NYISO': {'cost': 'nyiso_cost', 'iso': 'nyiso_iso'},
+}
+
+
+def data_version(iso):
+    """version ids of an ISO's local data, part of every cache key below"""
+    src = ISO_SOURCES[iso]
+    return store.version(src['cost']), store.version(src['iso'])
+
+
+def load_cost_map_data(iso):
+    """cost sample and market boundary for an ISO, shared by every session in the process
+
+    The frames are not copied per caller, so filter into new frames instead of
+    modifying them in place.
+    """
+    return _load_cost_map_data(iso, data_version(iso))
+
+
+@st.cache_resource(max_entries=len(ISO_SOURCES))
+def _load_cost_map_data(iso, version):
+    src = ISO_SOURCES[iso]
+    # geodf
+    gdf = store.read_geo(src['cost'])
+    # geoloc shape
+    gdf_iso = store.read_geo(src['iso'])
+    return gdf, gdf_iso
+
+
+def partition_index(iso):
+    """row positions of the priced projects for every (year, fuel, status)"""
+    return _partition_index(iso, data_version(iso))
+
+
+@st.cache_resource(max_entries=len(ISO_SOURCES))
+def _partition_index(iso, version):
+    gdf, _ = _load_cost_map_data(iso, version)
+    # not all of the records have cost information
+    priced = np.flatnonzero((gdf['total_cost/kw'] > 0).to_numpy(dtype=bool, na_value=False))
+    keys = gdf[PARTITION_KEYS].iloc[priced]
+    groups = keys.groupby(PARTITION_KEYS, observed=True, sort=False).indices
+    return {key: priced[pos] for key, pos in groups.items()}
+
+
+def select(iso, year, fuel, status, columns):
+    """priced projects for one filter tuple, materializing only the requested columns"""
+    version = data_version(iso)
+    gdf, _ = _load_cost_map_data(iso, version)
+    rows = _partition_index(iso, version).get((year, fuel, status), np.array([], dtype=np.intp))
+    return gdf.iloc[rows, gdf.columns.get_indexer(columns)]
+
+
+def box_stats(iso, year, fuel, status):
+    """box-plot summary of each cost column for one filter tuple, and its outliers
+
+    stats has a row per cost column with n, the quartiles and the whisker ends;
+    outliers has a (cost, value) row per point beyond the whiskers.
+    """
+    stats = _box_stats(iso, data_version(iso))
+    return stats.get((year, fuel, status)) or _summarize(np.empty((0, len(COST_COLUMNS))))
+
+
+@st.cache_resource(max_entries=len(ISO_SOURCES))
+def _box_stats(iso, version):
+    # every partition at once, so changing a filter only looks up a few dozen numbers
+    gdf, _ = _load_cost_map_data(iso, version)
+    costs = gdf[COST_COLUMNS].to_numpy(dtype=float, na_value=np.nan)
+    return {key: _summarize(costs[rows]) for key, rows in _partition_index(iso, version).items()}
+
+
+def _summarize(costs):
+    stats, outliers = [], []
+    for column, values in zip(COST_COLUMNS, costs.T):
+        values = values[~np.isnan(values)]
+        if not len(values):
+            continue
+        q1, median, q3 = np.percentile(values, [25, 50, 75])
+        lo, hi = q1 - WHIS * (q3 - q1), q3 + WHIS * (q3 - q1)
+        inside = values[(values >= lo) & (values <= hi)]
+        stats.append((column, len(values), q1, median, q3, inside.min(), inside.max()))
+        outliers += [(column, v) for v in values[(values < lo) | (values > hi)]]
+    return pd.DataFrame(stats, columns=BOX_COLUMNS), pd.DataFrame(outliers, columns=['cost', 'value'])
@@ -0,0 +1,119 @@
+import base64
+import hashlib
+import io
+import os
+
+import numpy as np
+import streamlit as st
+
+from common import assets
+
+# Optional server-side heat layer (IQ_SERVER_HEATMAP=1): the weighted kernel density is
+# computed here on a Web Mercator grid and sent as one PNG image overlay, instead of
+# every point going to Leaflet.heat to be re-blurred in the browser on each pan and
+# zoom. The image is made for the map's opening zoom; zooming in enlarges it.
+HEAT_DIR = assets.STATIC_DIR / 'heat'
+HEAT_URL = '/app/static/heat'
+MAX_PX = 1024
+
+# Leaflet.heat's default gradient, so both modes look alike
+GRADIENT = [(0.4, (0, 0, 255)), (0.6, (0, 255, 255)), (0.7, (0, 255, 0)), (0.8, (255, 255, 0)), (1.0, (255, 0, 0))]
+MIN_OPACITY = 0.05
+MAX_OPACITY = 0.8
+
+
+def enabled():
+    return os.environ.get('IQ_SERVER_HEATMAP') == '1'
+
+
+def _mercator_y(lat):
+    return np.log(np.tan(np.pi / 4 + np.radians(lat) / 2))
+
+
+def _latitude(y):
+    return np.degrees(2 * np.arctan(np.exp(y)) - np.pi / 2)
+
+
+def _convolve(a, kernel, axis):
+    # same-size convolution along one axis, for the whole grid at once through the fft
+    n = a.shape[axis] + len(kernel) - 1
+    shape = [1, 1]
+    shape[axis] = -1
+    full = np.fft.irfft(np.fft.rfft(a, n, axis=axis) * np.fft.rfft(kernel, n).reshape(shape), n, axis=axis)
+    r = len(kernel) // 2
+    return np.take(full, np.arange(r, r + a.shape[axis]), axis=axis)
+
+
+def _blur(grid, sigma):
+    r = max(int(np.ceil(3 * sigma)), 1)
+    kernel = np.exp(-0.5 * (np.arange(-r, r + 1) / sigma) ** 2)
+    kernel /= kernel.sum()
+    # the gaussian is separable: rows, then columns
+    return _convolve(_convolve(grid, kernel, 1), kernel, 0)
+
+
+def density(lon, lat, weights, zoom, radius=20, max_px=MAX_PX):
+    """weighted kernel density on a Web Mercator grid sized for a zoom level
+
+    radius is in screen pixels at that zoom, as for Leaflet.heat. Returns the grid,
+    north row first, and its [[south, west], [north, east]] bounds.
+    """
+    x = np.radians(np.asarray(lon, dtype=float))
+    y = _mercator_y(np.asarray(lat, dtype=float))
+    px_per_rad = 256 * 2 ** zoom / (2 * np.pi)
+    pad = 3 * radius / px_per_rad
+    x0, x1 = x.min() - pad, x.max() + pad
+    y0, y1 = y.min() - pad, y.max() + pad
+    # screen pixels per grid cell; coarser than 1 only for very wide extents
+    step = max((x1 - x0) * px_per_rad / max_px, (y1 - y0) * px_per_rad / max_px, 1.0)
+    nx = int(np.ceil((x1 - x0) * px_per_rad / step))
+    ny = int(np.ceil((y1 - y0) * px_per_rad / step))
+    grid, _, _ = np.histogram2d(y, x, bins=[ny, nx], range=[[y0, y1], [x0, x1]], weights=weights)
+    grid = _blur(grid, radius / step / 2)
+    bounds = [[_latitude(y0), np.degrees(x0)], [_latitude(y1), np.degrees(x1)]]
+    return grid[::-1], bounds
+
+
+def colorize(grid):
+    """RGBA image of a density grid with the Leaflet.heat gradient"""
+    peak = grid.max()
+    v = np.clip(grid / peak, 0, 1) if peak > 0 else np.zeros_like(grid)
+    stops = np.array([s for s, _ in GRADIENT])
+    colors = np.array([c for _, c in GRADIENT], dtype=float) / 255
+    rgb = np.stack([np.interp(v, stops, colors[:, i]) for i in range(3)], axis=-1)
+    alpha = np.where(v > 0, MIN_OPACITY + (MAX_OPACITY - MIN_OPACITY) * np.clip(v / stops[0], 0, 1), 0)
+    return np.dstack([rgb, alpha])
+
+
+def png(rgba):
+    from matplotlib.image import imsave
+
+    buf = io.BytesIO()
+    imsave(buf, rgba, format='png')
+    return buf.getvalue()
+
+
+def _image_url(data):
+    # a static file the browser caches when static serving is on, inline otherwise
+    if st.get_option('server.enableStaticServing'):
+        name = hashlib.sha256(data).hexdigest()[:16] + '.png'
+        path = HEAT_DIR / name
+        if not path.exists():
+            from common import store
+            with store.atomic_target(path) as tmp:
+                with open(tmp, 'wb') as f:
+                    f.write(data)
+        return f'{HEAT_URL}/{name}'
+    return 'data:image/png;base64,' + base64.b64encode(data).decode()
+
+
+def add_overlay(m, gdf, value, name, zoom, radius=20, latitude='lat', longitude='lon'):
+    """the server-side counterpart of m.add_heatmap(gdf, latitude, longitude, value, name, radius)"""
+    import folium
+
+    points = gdf[[longitude, latitude, value]].dropna()
+    if points.empty:
+        return
+    grid, bounds = density(points[longitude], points[latitude], points[value], zoom, radius)
+    folium.raster_layers.ImageOverlay(image=_image_url(png(colorize(grid))), bounds=bounds,
+                                      name=name, interactive=False, zindex=1).add_to(m)
@@ -0,0 +1,63 @@
+import geopandas as gpd
+
+from common import store
+
+# boundary and transmission layers that are shipped to the browser as GeoJSON
+LAYERS = ['iso_shapes', 'pjm_iso', 'pjm_trans', 'miso_iso', 'nyiso_iso']
+
+# (deepest zoom served, tolerance in degrees); about a quarter pixel at that zoom.
+# Anything zoomed in further gets the full resolution layer.
+SIMPLIFY_TIERS = [(5, 0.01), (8, 0.0015), (11, 0.0002)]
+COORDINATE_PRECISION = 5
+
+LAYER_DIR = store.DATA_DIR / 'layers'
+
+
+def tier_for_zoom(zoom):
+    for max_zoom, tolerance in SIMPLIFY_TIERS:
+        if zoom <= max_zoom:
+            return tolerance
+    return None
+
+
+def tier_path(name, tolerance):
+    # the source version is part of the name so a refreshed layer gets new tiers
+    suffix = 'full' if tolerance is None else f'{tolerance:g}'
+    return LAYER_DIR / f'{name}.{store.version(name)}.{suffix}.geojson'
+
+
+def _simplify(geoms, tolerance):
+    if geoms.geom_type.isin(['Polygon', 'MultiPolygon']).all():
+        # neighbouring polygons are simplified together, so a shared border stays
+        # shared instead of opening gaps and overlaps between markets
+        return geoms.simplify_coverage(tolerance)
+    return geoms.simplify(tolerance, preserve_topology=True)
+
+
+def build_tiers(name, force=False):
+    """write a topology-preserving simplified GeoJSON of a layer for every tier"""
+    gdf = None
+    for tolerance in [t for _, t in SIMPLIFY_TIERS] + [None]:
+        path = tier_path(name, tolerance)
+        if path.exists() and not force:
+            continue
+        if gdf is None:
+            gdf = store.read_geo(name).to_crs(4326)
+        tier = gdf
+        if tolerance is not None:
+            tier = gdf.copy()
+            tier['geometry'] = _simplify(gdf.geometry, tolerance)
+        with store.atomic_target(path) as tmp:
+            tier.to_file(tmp, driver='GeoJSON', COORDINATE_PRECISION=COORDINATE_PRECISION)
+
+
+def layer_for_zoom(name, zoom):
+    """local GeoJSON path of the layer simplified for a map zoom level"""
+    path = tier_path(name, tier_for_zoom(zoom))
+    if not path.exists():
+        build_tiers(name)
+    return str(path)
+
+
+def read_layer(name, zoom):
+    return gpd.read_file(layer_for_zoom(name, zoom))
@@ -0,0 +1,75 @@
+import json
+import re
+
+import geopandas as gpd
+from shapely.ops import unary_union
+
+from common import store
+
+# the national queue map split into one GeoParquet file per region
+SHARD_DIR = store.DATA_DIR / 'qmap'
+MANIFEST = SHARD_DIR / 'manifest.json'
+OPTION_COLUMNS = ['region', 'q_year', 'q_status', 'type_clean']
+
+
+def shard_path(region):
+    return SHARD_DIR / (re.sub(r'[^A-Za-z0-9]+', '_', region).strip('_') + '.parquet')
+
+
+def _manifest():
+    try:
+        with open(MANIFEST) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def build_shards(force=False):
+    """split the national queue map by region, once per version of it
+
+    The manifest also records the widget options so the page never needs the
+    national file to draw its filters.
+    """
+    version = store.version('qmap')
+    if _manifest().get('version') == version and not force:
+        return
+    gdf = store.read_geo('qmap')
+    options = {col: store.values('qmap', col) for col in OPTION_COLUMNS}
+    for region, shard in gdf.groupby('region', observed=True, sort=False):
+        with store.atomic_target(shard_path(region)) as tmp:
+            shard.to_parquet(tmp, index=False)
+    # written last: its presence means every shard is in place
+    with store.atomic_target(MANIFEST) as tmp:
+        with open(tmp, 'w') as f:
+            json.dump({'version': version, 'options': options}, f)
+
+
+def load_options():
+    build_shards()
+    return _manifest()['options']
+
+
+def read_region(region):
+    build_shards()
+    return gpd.read_parquet(shard_path(region))
+
+
+def county_geometries(gdf):
+    """one geometry per distinct county shape, indexed by the geom_id assigned at sync"""
+    return gdf.drop_duplicates('geom_id').set_index('geom_id').geometry
+
+
+def aggregate_counties(df, geoms):
+    """same result as dissolve(by='NAME') on duration and capacity, without the polygon unions
+
+    Attributes are grouped in pandas and each county's shape is looked up by geom_id.
+    Only a name that covers several distinct shapes (e.g. the same county name in two
+    states) is unioned, as dissolve would.
+    """
+    agg = df.groupby('NAME', as_index=False, sort=True).agg({'diff_months_cod': 'mean', 'mw1': 'sum'})
+    shapes = df[['NAME', 'geom_id']].dropna().drop_duplicates()
+    single = ~shapes['NAME'].duplicated(keep=False)
+    county_geom = geoms.reindex(shapes.loc[single, 'geom_id']).set_axis(shapes.loc[single, 'NAME'])
+    for name, ids in shapes.loc[~single].groupby('NAME')['geom_id']:
+        county_geom[name] = unary_union(list(geoms.reindex(ids)))
+    return gpd.GeoDataFrame(agg, geometry=agg['NAME'].map(county_geom).values, crs=geoms.crs)
@@ -0,0 +1,237 @@
+import os
+
+import pandas as pd
+import pyarrow as pa
+import streamlit as st
+
+from common import shared, store
+from common.cache import LRUCache
+
+# Filters and group-bys run against the local parquet files instead of in-memory frames.
+# Only the referenced columns are read and the filters are pushed down to the reader;
+# every backend hands back pandas, typed by the store schema, for the chart code.
+#   IQ_QUERY_BACKEND=pandas   pyarrow reader with row-group filtering (default)
+#   IQ_QUERY_BACKEND=duckdb   DuckDB over read_parquet()
+#   IQ_QUERY_BACKEND=polars   Polars lazy scan_parquet()
+BACKEND = os.environ.get('IQ_QUERY_BACKEND', 'pandas')
+
+# Results are shared by every session in the process, keyed by the source version and
+# the query itself, and evicted least-recently-used once they pass the size budget.
+# With the host-wide Arrow tier on (common/shared.py) a miss falls through to it before
+# querying, and this cache keeps the mapped table rather than a frame of its own.
+RESULT_CACHE_BYTES = int(os.environ.get('IQ_RESULT_CACHE_MB', '128')) * 2 ** 20
+
+# where: list of (column, op, value) with op one of OPS, all of them and-ed
+OPS = ('==', '>', '>=', '<', '<=', 'in')
+# part of every aggregate cache key; bump it when the dtypes or layout of results change,
+# so the Arrow files left on disk by an older release are not served
+AGGREGATE_FORMAT = 2
+
+# aggs: {output column: (column, func)} as in pandas named aggregation
+FUNCS = ('sum', 'count', 'size', 'mean')
+
+
+def _sizeof(value):
+    if isinstance(value, pa.Table):
+        return value.nbytes
+    return int(value.memory_usage(deep=True).sum())
+
+
+@st.cache_resource
+def result_cache():
+    return LRUCache(RESULT_CACHE_BYTES, sizeof=_sizeof)
+
+
+def cache_stats():
+    """entries, bytes, hits, misses and evictions of the result cache"""
+    return result_cache().stats()
+
+
+def _cached(key, create):
+    if shared.enabled():
+        # the LRU holds the memory-mapped Arrow table, whose buffers are the page cache
+        # every worker shares, and only the caller's frame is converted, on each read
+        table = result_cache().get_or_create(key, lambda: shared.get_or_create_table(key, create))
+        return shared.to_pandas(table)
+    return result_cache().get_or_create(key, create)
+
+
+def _key(*parts):
+    # filter values arrive as lists from widgets; freeze them for the cache key
+    return tuple(tuple(p) if isinstance(p, list) else p for p in parts)
+
+
+def _where_key(where):
+    return tuple(_key(col, op, value) for col, op, value in where)
+
+
+def _empty(where):
+    # an empty 'in' matches nothing; answered without reading, as no engine accepts IN ()
+    return any(op == 'in' and not len(value) for _, op, value in where)
+
+
+def _value_columns(aggs):
+    return list(dict.fromkeys(col for col, _ in aggs.values()))
+
+
+# pandas
+
+def _pandas_filters(where):
+    return [(col, op, list(value) if op == 'in' else value) for col, op, value in where] or None
+
+
+def _pandas_select(name, columns, where):
+    return store.read_table(name, columns=columns, filters=_pandas_filters(where))
+
+
+def _pandas_aggregate(name, by, aggs, where, dropna):
+    df = store.read_table(name, columns=by + _value_columns(aggs), filters=_pandas_filters(where))
+    # pandas sums in the column's dtype; accumulate the float32 columns in float64
+    values = [col for col in _value_columns(aggs) if col not in by and df[col].dtype == 'float32']
+    df = df.astype({col: 'float64' for col in values})
+    return df.groupby(by, observed=True, dropna=dropna, as_index=False).agg(**aggs)
+
+
+# duckdb
+
+def _quote(col):
+    return '"' + col.replace('"', '""') + '"'
+
+
+def _duckdb_where(where):
+    clauses, params = [], []
+    for col, op, value in where:
+        if op == 'in':
+            clauses.append(f"{_quote(col)} IN ({', '.join('?' * len(value))})")
+            params.extend(value)
+        else:
+            clauses.append(f'{_quote(col)} {"=" if op == "==" else op} ?')
+            params.append(value)
+    return clauses, params
+
+
+def _duckdb_agg(col, func):
+    if func == 'size':
+        return 'count(*)'
+    if func == 'sum':
+        # pandas sums an all-null group to 0
+        return f'coalesce(sum({_quote(col)}), 0)'
+    return f"{'avg' if func == 'mean' else func}({_quote(col)})"
+
+
+def _duckdb_run(name, select, clauses, params, tail=''):
+    import duckdb
+
+    where = f" WHERE {' AND '.join(clauses)}" if clauses else ''
+    sql = f'SELECT {select} FROM read_parquet(?){where}{tail}'
+    with duckdb.connect() as con:
+        return con.execute(sql, [str(store.sync(name))] + params).df()
+
+
+def _duckdb_select(name, columns, where):
+    clauses, params = _duckdb_where(where)
+    return _duckdb_run(name, ', '.join(map(_quote, columns)), clauses, params)
+
+
+def _duckdb_aggregate(name, by, aggs, where, dropna):
+    clauses, params = _duckdb_where(where)
+    if dropna:
+        clauses += [f'{_quote(col)} IS NOT NULL' for col in by]
+    keys = ', '.join(map(_quote, by))
+    select = ', '.join([keys] + [f'{_duckdb_agg(col, func)} AS {_quote(out)}'
+                                 for out, (col, func) in aggs.items()])
+    return _duckdb_run(name, select, clauses, params, f' GROUP BY {keys} ORDER BY {keys}')
+
+
+# polars
+
+def _polars_scan(name, columns, where, dropna_by=()):
+    import polars as pl
+
+    # filter before projecting: where may use columns that are not selected
+    lf = pl.scan_parquet(str(store.sync(name)))
+    for col, op, value in where:
+        c = pl.col(col)
+        lf = lf.filter({'==': c == value, '>': c > value, '>=': c >= value,
+                        '<': c < value, '<=': c <= value}[op] if op != 'in' else c.is_in(list(value)))
+    for col in dropna_by:
+        lf = lf.filter(pl.col(col).is_not_null())
+    return lf.select(columns)
+
+
+def _polars_agg(col, func):
+    import polars as pl
+
+    # counts as int64, like pandas and duckdb, not polars' uint32
+    if func == 'size':
+        return pl.len().cast(pl.Int64)
+    if func == 'count':
+        return pl.col(col).count().cast(pl.Int64)
+    # polars sums in the column's dtype; accumulate in float64 as the other backends do
+    return getattr(pl.col(col).cast(pl.Float64), func)()
+
+
+def _polars_select(name, columns, where):
+    return _polars_scan(name, columns, where).collect().to_pandas()
+
+
+def _polars_aggregate(name, by, aggs, where, dropna):
+    lf = _polars_scan(name, by + _value_columns(aggs), where, by if dropna else ())
+    lf = lf.group_by(by).agg([_polars_agg(col, func).alias(out) for out, (col, func) in aggs.items()])
+    return lf.sort(by, nulls_last=True).collect().to_pandas()
+
+
+BACKENDS = {
+    'pandas': (_pandas_select, _pandas_aggregate),
+    'duckdb': (_duckdb_select, _duckdb_aggregate),
+    'polars': (_polars_select, _polars_aggregate),
+}
+
+
+def _check(where, aggs=None):
+    for _, op, _ in where:
+        if op not in OPS:
+            raise ValueError(f'unsupported filter op {op!r}')
+    for _, func in (aggs or {}).values():
+        if func not in FUNCS:
+            raise ValueError(f'unsupported aggregation {func!r}')
+
+
+def _select(name, columns, where):
+    if _empty(where):
+        import pyarrow.parquet as pq
+        empty = pq.read_schema(store.sync(name)).empty_table().select(columns).to_pandas()
+        return store.typed(name, empty)
+    return store.typed(name, BACKENDS[BACKEND][0](name, columns, where))
+
+
+def _aggregate(name, by, aggs, where, dropna):
+    if _empty(where):
+        return pd.DataFrame(columns=by + list(aggs))
+    # only the keys take the store's dtypes; sums and means stay at the backend's
+    # float64/int64 instead of the narrow float32 of the raw column
+    return store.typed(name, BACKENDS[BACKEND][1](name, by, aggs, where, dropna), columns=by)
+
+
+def select(name, columns, where=()):
+    """rows of a source matching where, with only the given columns (in file order)
+
+    The frame is shared through the result cache; copy it before modifying in place.
+    """
+    where = list(where)
+    _check(where)
+    columns = store.column_order(name, columns)
+    key = ('select', name, store.version(name), tuple(columns), _where_key(where))
+    return _cached(key, lambda: _select(name, columns, where))
+
+
+def aggregate(name, by, aggs, where=(), dropna=True):
+    """df[where].groupby(by, observed=True, dropna=dropna, as_index=False).agg(**aggs), sorted by key
+
+    The frame is shared through the result cache; copy it before modifying in place.
+    """
+    where = list(where)
+    by = list(by)
+    _check(where, aggs)
+    key = ('aggregate', AGGREGATE_FORMAT, name, store.version(name), tuple(by), tuple(aggs.items()), _where_key(where), dropna)
+    return _cached(key, lambda: _aggregate(name, by, aggs, where, dropna))
@@ -0,0 +1,29 @@
+import os
+
+import streamlit as st
+import streamlit.components.v1 as components
+
+from common.cache import LRUCache
+
+# final map html shared by every session in the process, keyed by page and filters
+RENDER_CACHE_BYTES = int(os.environ.get('IQ_RENDER_CACHE_MB', '64')) * 2 ** 20
+
+
+@st.cache_resource
+def render_cache():
+    return LRUCache(RENDER_CACHE_BYTES, sizeof=lambda html: len(html.encode()))
+
+
+def cache_stats():
+    """entries, bytes, hits, misses and evictions of the map html cache"""
+    return render_cache().stats()
+
+
+def map_html(key, build):
+    """html of the map for key; build() returns the map and is only called on a miss"""
+    return render_cache().get_or_create(key, lambda: build().to_html())
+
+
+def show_map(html, height):
+    # what leafmap's Map.to_streamlit does with the html
+    components.html(html, height=height)
@@ -0,0 +1,84 @@
+import hashlib
+import os
+from pathlib import Path
+
+import pyarrow as pa
+
+from common import store
+
+# Second cache tier shared by every worker on the host. A result is written once as an
+# uncompressed Arrow IPC file and memory-mapped by readers, so the OS page cache holds
+# one copy of the column buffers for all processes instead of one per worker.
+# IQ_SHARED_CACHE_MB=0 turns the tier off.
+SHARED_DIR = Path(os.environ.get('IQ_SHARED_DIR', store.DATA_DIR / 'shared'))
+SHARED_CACHE_BYTES = int(os.environ.get('IQ_SHARED_CACHE_MB', '1024')) * 2 ** 20
+
+
+def enabled():
+    return SHARED_CACHE_BYTES > 0
+
+
+def path_for(key):
+    # keys hold only strings, numbers and tuples, so repr is the same in every worker
+    return SHARED_DIR / (hashlib.sha1(repr(key).encode()).hexdigest() + '.arrow')
+
+
+def get_table(key):
+    """the Arrow table stored under key, its buffers in the mapped file, or None"""
+    path = path_for(key)
+    try:
+        source = pa.memory_map(str(path))
+    except FileNotFoundError:
+        return None
+    table = pa.ipc.open_file(source).read_all()
+    try:
+        # recency for _trim
+        os.utime(path)
+    except FileNotFoundError:
+        pass
+    return table
+
+
+def to_pandas(table):
+    # columns arrow cannot hand over as they are (nullable ints, floats with nulls) are copied
+    return table.to_pandas(split_blocks=True)
+
+
+def put(key, df):
+    table = pa.Table.from_pandas(df)
+    with store.atomic_target(path_for(key)) as tmp:
+        with pa.OSFile(tmp, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    _trim()
+
+
+def _trim():
+    # drop the least recently used files past the budget; a worker that still has one
+    # mapped keeps reading it, the data is freed once the last mapping goes
+    files = []
+    for path in SHARED_DIR.glob('*.arrow'):
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+    total = 0
+    for _, size, path in sorted(files, key=lambda f: f[0], reverse=True):
+        total += size
+        if total > SHARED_CACHE_BYTES:
+            path.unlink(missing_ok=True)
+
+
+def get_or_create_table(key, create):
+    """the mapped table under key; create() builds the DataFrame on a miss"""
+    # two workers missing together may both build; the last rename wins, both are identical
+    table = get_table(key)
+    if table is None:
+        df = create()
+        put(key, df)
+        # read back mapped, so this worker holds no copy of its own either
+        table = get_table(key)
+        if table is None:
+            # larger than the whole budget and trimmed right away
+            table = pa.Table.from_pandas(df)
+    return table
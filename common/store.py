@@ -0,0 +1,421 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from contextlib import contextmanager
+from pathlib import Path
+
+import pandas as pd
+
+# Local columnar copy of the upstream data. Each source is fetched once, typed and
+# written to parquet; every page then reads from disk instead of the remote file.
+DATA_DIR = Path(os.environ.get('IQ_DATA_DIR', Path(__file__).resolve().parent.parent / '.data'))
+
+# how long a local copy is served before upstream is checked for changes again
+REFRESH_SECONDS = int(os.environ.get('IQ_REFRESH_SECONDS', str(6 * 3600)))
+
+# after a failed check, wait this long before the next one, doubling with every failure
+# in a row up to REFRESH_SECONDS
+RETRY_SECONDS = 300
+
+# behind a firewall: serve whatever is on disk and never check upstream
+OFFLINE = os.environ.get('IQ_OFFLINE') == '1'
+
+# seconds a connect or read may stall; downloads run under the source lock other workers wait on
+FETCH_TIMEOUT = 30
+
+logger = logging.getLogger(__name__)
+
+LINK_PREFIX = "https://raw.githubusercontent.com/kman2022/data/main/main/"
+
+GITHUB_RAW = "https://github.com/kman2022/data/blob/main/main/"
+
+QUEUE_CATEGORIES = ['region', 'q_status', 'type_clean']
+COST_CATEGORIES = ['fuel', 'request_status']
+
+# Declared dtypes per dataset, applied when a source is converted and again on load so
+# older local copies are narrowed too: categoricals for the repeated labels (filters
+# compare integer codes), nullable Int16 for years, float32 for MW, months and $/kW.
+QUEUE_SCHEMA = {'category': QUEUE_CATEGORIES,
+                'Int16': ['q_year', 'cod_year'],
+                'float32': ['mw1', 'diff_months_ia', 'diff_months_cod', 'diff_months_wd']}
+COST_SCHEMA = {'category': COST_CATEGORIES,
+               'Int16': ['q_year'],
+               'float32': ['nameplate_mw', 'poi_cost/kw', 'network_cost/kw', 'total_cost/kw']}
+
+# tabular sources (csv -> parquet)
+SOURCES = {
+    'trend': {'url': LINK_PREFIX + "berkley/df_trend.csv",
+              'schema': QUEUE_SCHEMA},
+    'trend_dur': {'url': LINK_PREFIX + "berkley/df_trend_dur.csv",
+                  'schema': QUEUE_SCHEMA},
+}
+
+# spatial sources (geojson -> geoparquet)
+GEO_SOURCES = {
+    'qmap': {'url': LINK_PREFIX + "berkley/gdp_iq_qeo.geojson",
+             'schema': QUEUE_SCHEMA,
+             'geom_ids': True},
+    'iso_shapes': {'url': LINK_PREFIX + "berkley/geojson_iso.json",
+                   'schema': {}},
+    # interconnection cost samples, normalized to one column layout across ISOs
+    'pjm_cost': {'url': GITHUB_RAW + "berkley/gdf_pjm_cost_map_agg.geojson?raw=true",
+                 'schema': COST_SCHEMA,
+                 'centroids': True,
+                 'rename': {'$2022_poi_cost/kw': 'poi_cost/kw',
+                            '$2022_network_cost/kw': 'network_cost/kw',
+                            '$2022_total_cost/kw': 'total_cost/kw'}},
+    'miso_cost': {'url': GITHUB_RAW + "berkley/gdp_cost_miso_qeo.geojson?raw=true",
+                  'schema': COST_SCHEMA,
+                  'centroids': True,
+                  'rename': {'real_poi/kw': 'poi_cost/kw',
+                             'real_network/kw': 'network_cost/kw',
+                             'real_total/kw': 'total_cost/kw'}},
+    'nyiso_cost': {'url': GITHUB_RAW + "berkley/gdp_cost_nyiso_qeo.geojson?raw=true",
+                   'schema': COST_SCHEMA,
+                   'centroids': True,
+                   # network cost is published as text with ' $-   ' for zero
+                   'replace': {' $-   ': 0},
+                   'numeric': ['$2022_network_cost/kw'],
+                   'rename': {'$2022_poi_cost/kw': 'poi_cost/kw',
+                              '$2022_network_cost/kw': 'network_cost/kw',
+                              '$2022_total_cost/kw': 'total_cost/kw',
+                              'resource_type': 'fuel',
+                              'county': 'NAME'}},
+    'pjm_iso': {'url': GITHUB_RAW + "berkley/pjm.geojson?raw=true",
+                'schema': {}},
+    'pjm_trans': {'url': GITHUB_RAW + "berkley/pjm_transmission_short.geojson?raw=true",
+                  'schema': {}},
+    'miso_iso': {'url': GITHUB_RAW + "berkley/miso.geojson?raw=true",
+                 'schema': {}},
+    'nyiso_iso': {'url': GITHUB_RAW + "berkley/nyiso.geojson?raw=true",
+                  'schema': {}},
+}
+
+
+def local_path(name):
+    return DATA_DIR / f'{name}.parquet'
+
+
+def meta_path(name):
+    return DATA_DIR / f'{name}.meta.json'
+
+
+def _source(name):
+    return SOURCES[name] if name in SOURCES else GEO_SOURCES[name]
+
+
+@contextmanager
+def atomic_target(path):
+    """yield a temp path next to path and rename it into place on success
+
+    Readers never see a partial file, even with several workers syncing at once.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+    os.close(fd)
+    try:
+        yield tmp
+        os.replace(tmp, path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _atomic_write(df, path):
+    with atomic_target(path) as tmp:
+        df.to_parquet(tmp, index=False)
+
+
+def _read_meta(name):
+    try:
+        with open(meta_path(name)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_meta(name, meta):
+    with atomic_target(meta_path(name)) as tmp:
+        with open(tmp, 'w') as f:
+            json.dump(meta, f)
+
+
+@contextmanager
+def _locked(name, blocking=True):
+    """cross-process lock per source; yields False when non-blocking and already held"""
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    with open(DATA_DIR / f'{name}.lock', 'w') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _apply_schema(df, schema):
+    # only the columns present: pages load column subsets
+    for dtype, cols in schema.items():
+        for col in cols:
+            if col in df.columns and df[col].dtype != dtype:
+                df[col] = df[col].astype(dtype)
+    return df
+
+
+def _apply_types(df, schema):
+    df = _apply_schema(df, schema)
+    # parquet needs a single type per column; mixed object columns become strings
+    for col in df.columns:
+        if df[col].dtype == object and col != 'geometry':
+            df[col] = df[col].astype('string')
+    return df
+
+
+def _normalize(df, src):
+    # one-off cleanup and renames, done at sync time instead of on every load
+    if 'replace' in src:
+        df = df.replace(src['replace'])
+    for col in src.get('numeric', []):
+        df[col] = pd.to_numeric(df[col])
+    rename = src.get('rename', {})
+    # a target that already exists (e.g. a NAME next to nyiso's county) is replaced by the
+    # renamed column, instead of leaving two columns with one label that parquet rejects
+    clash = [new for old, new in rename.items() if old in df.columns and new in df.columns and new not in rename]
+    return df.drop(columns=clash).rename(columns=rename)
+
+
+def _add_centroids(gdf):
+    # reproject and locate each geometry once; pages only read the float columns
+    gdf = gdf.to_crs(4326)
+    centroid = gdf.centroid
+    gdf['lon'] = centroid.x
+    gdf['lat'] = centroid.y
+    return gdf
+
+
+def _add_geom_ids(gdf):
+    # projects in the same county repeat the county polygon; number each distinct shape
+    gdf['geom_id'] = pd.factorize(gdf.geometry.to_wkb())[0]
+    return gdf
+
+
+def _distinct(series):
+    # plain python values in order of first appearance, for json and widget options
+    return [v.item() if hasattr(v, 'item') else v for v in series.dropna().unique()]
+
+
+def _value_index(df, schema):
+    # distinct labels and years, kept in the meta file so option lists never need the data
+    cols = schema.get('category', []) + schema.get('Int16', [])
+    return {col: _distinct(df[col]) for col in cols if col in df.columns}
+
+
+def _store_frame(name, df):
+    # type a normalized frame, add the derived columns, swap it into place; returns its value index
+    src = _source(name)
+    df = _apply_types(df, src['schema'])
+    if src.get('centroids'):
+        df = _add_centroids(df)
+    if src.get('geom_ids'):
+        df = _add_geom_ids(df)
+    _atomic_write(df, local_path(name))
+    return _value_index(df, src['schema'])
+
+
+def _convert(name, raw):
+    # parse a downloaded source into the store
+    if name in SOURCES:
+        return _store_frame(name, pd.read_csv(raw))
+    import geopandas as gpd
+
+    return _store_frame(name, _normalize(gpd.read_file(raw), _source(name)))
+
+
+def put(name, df, version):
+    """write a frame in the normalized column layout straight into the store
+
+    For generated data: the copy is marked synthetic so it is never refreshed from
+    upstream. Delete its .parquet and .meta.json to go back to the real source.
+    """
+    with _locked(name):
+        values = _store_frame(name, df)
+        _write_meta(name, {'version': version, 'values': values, 'synthetic': True, 'checked_at': time.time()})
+
+
+def _fetch(name):
+    """download a source if it changed upstream; the caller holds its lock
+
+    Uses ETag/Last-Modified when the server sends them and a content hash
+    otherwise, so an unchanged file is never parsed again.
+    """
+    meta = _read_meta(name) if local_path(name).exists() else {}
+    req = urllib.request.Request(_source(name)['url'])
+    if meta.get('etag'):
+        req.add_header('If-None-Match', meta['etag'])
+    if meta.get('last_modified'):
+        req.add_header('If-Modified-Since', meta['last_modified'])
+    try:
+        resp = urllib.request.urlopen(req, timeout=FETCH_TIMEOUT)
+    except urllib.error.HTTPError as e:
+        if e.code != 304:
+            raise
+        meta['checked_at'] = time.time()
+        _clear_failures(meta)
+        _write_meta(name, meta)
+        return False
+
+    digest = hashlib.sha256()
+    fd, raw = tempfile.mkstemp(dir=DATA_DIR, suffix='.download')
+    try:
+        with resp, os.fdopen(fd, 'wb') as out:
+            for chunk in iter(lambda: resp.read(1 << 20), b''):
+                digest.update(chunk)
+                out.write(chunk)
+        changed = digest.hexdigest() != meta.get('sha256')
+        if changed:
+            meta['values'] = _convert(name, raw)
+    finally:
+        os.remove(raw)
+    meta.update(etag=resp.headers.get('ETag'), last_modified=resp.headers.get('Last-Modified'),
+                sha256=digest.hexdigest(), version=digest.hexdigest()[:12], checked_at=time.time())
+    _clear_failures(meta)
+    _write_meta(name, meta)
+    return changed
+
+
+def _clear_failures(meta):
+    meta.pop('failures', None)
+    meta.pop('retry_at', None)
+
+
+def _record_failure(name):
+    # back off, so a source that keeps failing is not checked again on every rerun
+    with _locked(name, blocking=False) as acquired:
+        if not acquired:
+            return None
+        meta = _read_meta(name)
+        failures = meta.get('failures', 0) + 1
+        delay = min(RETRY_SECONDS * 2 ** (failures - 1), REFRESH_SECONDS)
+        meta.update(failures=failures, retry_at=time.time() + delay)
+        _write_meta(name, meta)
+        return delay
+
+
+def sync(name):
+    """make sure a source is in the local store, fetching it on first use"""
+    path = local_path(name)
+    if not path.exists():
+        # every worker waits for the one doing the first download
+        with _locked(name):
+            if not path.exists():
+                _fetch(name)
+    return path
+
+
+def refresh(name):
+    """check a source upstream and swap in new data; returns True if it changed
+
+    Skipped when another worker is already refreshing the same source.
+    """
+    sync(name)
+    if _read_meta(name).get('synthetic'):
+        return False
+    with _locked(name, blocking=False) as acquired:
+        return acquired and _fetch(name)
+
+
+_refreshing = set()
+_refreshing_lock = threading.Lock()
+
+
+def _refresh_in_background(name):
+    with _refreshing_lock:
+        if name in _refreshing:
+            return
+        _refreshing.add(name)
+
+    def run():
+        try:
+            refresh(name)
+        except Exception:
+            # upstream unreachable or its payload unreadable; keep serving the local copy
+            delay = _record_failure(name)
+            logger.warning('refresh of %s failed; next check in %s s', name,
+                           'another worker\'s' if delay is None else int(delay), exc_info=True)
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(name)
+
+    threading.Thread(target=run, name=f'refresh-{name}', daemon=True).start()
+
+
+def version(name):
+    """id of the local copy of a source, for cache keys
+
+    A stale copy is still served while a background thread checks upstream; the
+    new version shows up on a later call once it has been swapped in.
+    """
+    path = sync(name)
+    meta = _read_meta(name)
+    now = time.time()
+    if (not OFFLINE and not meta.get('synthetic') and now - meta.get('checked_at', 0) > REFRESH_SECONDS
+            and now >= meta.get('retry_at', 0)):
+        _refresh_in_background(name)
+    return meta.get('version') or str(int(path.stat().st_mtime))
+
+
+def values(name, column):
+    """distinct values of a categorical or year column, in order of first appearance
+
+    Read from the index recorded at sync; a copy synced before the index existed
+    falls back to reading the one column.
+    """
+    sync(name)
+    index = _read_meta(name).get('values', {})
+    if column in index:
+        return index[column]
+    return _distinct(read_table(name, columns=[column])[column])
+
+
+def column_order(name, columns):
+    """columns in the file's order, so positional slicing (iloc) behaves like read_csv(usecols=...)"""
+    import pyarrow.parquet as pq
+
+    names = pq.read_schema(sync(name)).names
+    return [c for c in names if c in columns]
+
+
+def typed(name, df, columns=None):
+    """df with a source's declared dtypes, for frames that did not come from read_table
+
+    columns limits the typing to those columns, e.g. the group keys of an aggregate.
+    """
+    schema = _source(name)['schema']
+    if columns is not None:
+        schema = {dtype: [c for c in cols if c in columns] for dtype, cols in schema.items()}
+    return _apply_schema(df, schema)
+
+
+def read_table(name, columns=None, filters=None):
+    """a source as pandas; filters (pyarrow form) are applied while reading row groups"""
+    path = sync(name)
+    columns = None if columns is None else column_order(name, columns)
+    return typed(name, pd.read_parquet(path, columns=columns, filters=filters))
+
+
+def read_geo(name, columns=None):
+    import geopandas as gpd
+
+    path = sync(name)
+    columns = None if columns is None else column_order(name, columns)
+    return typed(name, gpd.read_parquet(path, columns=columns))
@@ -0,0 +1,207 @@
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+from common import store
+
+# Synthetic stand-ins for every upstream source, in the normalized column layout the
+# store keeps, for load testing at sizes the published files do not reach. Shares and
+# shapes follow the LBNL queue and cost reports loosely; they are not estimates.
+
+# rows in the published files; generate() scales from these
+BASE_ROWS = {'queue': 25000, 'qmap': 21000, 'pjm_cost': 1127, 'miso_cost': 900, 'nyiso_cost': 450}
+
+# approximate footprint of each market: (min lon, min lat, max lon, max lat)
+REGION_BOUNDS = {
+    'CAISO': (-124.0, 32.5, -114.5, 42.0),
+    'ISO-NE': (-73.5, 41.0, -67.0, 47.5),
+    'MISO': (-104.0, 29.0, -84.0, 49.0),
+    'PJM': (-90.0, 36.0, -74.0, 42.5),
+    'NYISO': (-79.5, 40.5, -72.0, 45.0),
+    'SPP': (-104.0, 31.0, -94.0, 49.0),
+    'ERCOT': (-104.5, 26.0, -94.0, 36.0),
+    'Southeast (non-ISO)': (-92.0, 25.0, -76.0, 36.5),
+    'West (non-ISO)': (-124.0, 31.0, -103.0, 49.0),
+}
+# share of queue requests per region
+REGION_MIX = {'PJM': 0.24, 'MISO': 0.19, 'CAISO': 0.12, 'SPP': 0.1, 'ERCOT': 0.1, 'West (non-ISO)': 0.09,
+              'Southeast (non-ISO)': 0.08, 'NYISO': 0.05, 'ISO-NE': 0.03}
+# names the iso_shapes layer uses for the markets (see REGION_MAP on the Queued Up Map page)
+ISO_NAMES = {'CAISO': 'CALIFORNIA INDEPENDENT SYSTEM OPERATOR',
+             'ISO-NE': 'ISO NEW ENGLAND INC.',
+             'MISO': 'MIDCONTINENT INDEPENDENT TRANSMISSION SYSTEM OPERATOR, INC..',
+             'NYISO': 'NEW YORK INDEPENDENT SYSTEM OPERATOR',
+             'PJM': 'PJM INTERCONNECTION, LLC',
+             'SPP': 'SOUTHWEST POWER POOL',
+             'ERCOT': 'ELECTRIC RELIABILITY COUNCIL OF TEXAS, INC.'}
+
+STATUS_MIX = {'withdrawn': 0.5, 'active': 0.33, 'operational': 0.13, 'suspended': 0.04}
+FUEL_MIX = {'Solar': 0.34, 'Wind': 0.14, 'Battery': 0.12, 'Gas': 0.12, 'Solar+Battery': 0.11, 'Other': 0.03,
+            'Hydro': 0.02, 'Offshore Wind': 0.02, 'Wind+Battery': 0.02, 'Other Storage': 0.02,
+            'Geothermal': 0.01, 'Nuclear': 0.005, 'Coal': 0.005, 'Gas+Battery': 0.005, 'Solar+Wind': 0.005,
+            'Gas+Solar': 0.0025, 'Solar+Gas': 0.0025, 'Battery+Gas': 0.0025, 'Wind+Storage': 0.0025,
+            'Wind+Gas': 0.0025, 'CSP': 0.0025}
+COST_STATUS_MIX = {'Withdrawn': 0.4, 'Active': 0.35, 'Complete': 0.25}
+COST_FUEL_MIX = {'Solar': 0.45, 'Solar+Storage': 0.12, 'Storage': 0.15, 'Wind': 0.1, 'Gas': 0.1,
+                 'Offshore Wind': 0.02, 'Other': 0.06}
+COST_ISOS = {'pjm_cost': 'PJM', 'miso_cost': 'MISO', 'nyiso_cost': 'NYISO'}
+# (q_year, fuel, request_status) each heatmap page opens on
+COST_DEFAULTS = {'PJM': (2020, 'Solar', 'Complete'), 'MISO': (2020, 'Solar', 'Withdrawn'),
+                 'NYISO': (2019, 'Solar', 'Active')}
+
+# side of a synthetic county in degrees
+COUNTY_SIZE = 0.5
+
+TREND_COLUMNS = ['q_year', 'q_status', 'cod_year', 'type_clean', 'mw1', 'region']
+DUR_COLUMNS = TREND_COLUMNS + ['ix_voltage', 'diff_months_ia', 'diff_months_cod', 'diff_months_wd']
+
+
+def _pick(rng, mix, n):
+    p = np.array(list(mix.values()), dtype=float)
+    return rng.choice(list(mix), size=n, p=p / p.sum())
+
+
+def _years(rng, n, first, last, growth):
+    # requests grow by `growth` a year
+    years = np.arange(first, last + 1)
+    return _pick(rng, dict(zip(years, growth ** (years - first))), n).astype(int)
+
+
+def _ensure(df, col, values):
+    # the pages open on fixed defaults (PJM, 2020, Solar, ...); make sure they exist at any size
+    for i, value in enumerate(values[:len(df)]):
+        df.loc[i, col] = value
+
+
+def counties(region):
+    """grid of square counties covering a region, as a GeoDataFrame with NAME"""
+    import geopandas as gpd
+    from shapely.geometry import box
+
+    x0, y0, x1, y1 = REGION_BOUNDS[region]
+    cells = [box(x, y, x + COUNTY_SIZE, y + COUNTY_SIZE)
+             for x in np.arange(x0, x1, COUNTY_SIZE) for y in np.arange(y0, y1, COUNTY_SIZE)]
+    names = [f'{region} {i:03d}' for i in range(len(cells))]
+    return gpd.GeoDataFrame({'NAME': names}, geometry=cells, crs=4326)
+
+
+def _place(rng, regions):
+    # a random county of each row's region
+    import geopandas as gpd
+
+    names = np.empty(len(regions), dtype=object)
+    geoms = np.empty(len(regions), dtype=object)
+    for region in np.unique(regions):
+        grid = counties(region)
+        rows = np.flatnonzero(regions == region)
+        pick = rng.integers(0, len(grid), size=len(rows))
+        names[rows] = grid['NAME'].to_numpy()[pick]
+        geoms[rows] = grid.geometry.to_numpy()[pick]
+    return names, gpd.GeoSeries(geoms, crs=4326)
+
+
+def queue_frame(rng, n, region_mix=REGION_MIX):
+    """queue requests with trend_dur's columns"""
+    status = _pick(rng, STATUS_MIX, n)
+    q_year = _years(rng, n, 2000, 2021, 1.15)
+    operational = status == 'operational'
+    cod_months = np.where(operational, rng.gamma(4.0, 10.0, n), np.nan)
+    cod_year = np.where(operational, np.minimum(q_year + cod_months // 12, 2022), np.nan)
+    signed = operational | ((status == 'active') & (rng.random(n) < 0.5))
+    ia_months = np.where(signed, rng.gamma(3.0, 10.0, n), np.nan)
+    wd_months = np.where(status == 'withdrawn', rng.gamma(2.0, 12.0, n), np.nan)
+    mw1 = np.clip(rng.lognormal(np.log(80), 1.1, n), 0.5, 2500)
+    mw1[rng.random(n) < 0.02] = np.nan
+    df = pd.DataFrame({
+        'q_year': q_year, 'q_status': status, 'cod_year': cod_year, 'type_clean': _pick(rng, FUEL_MIX, n),
+        'mw1': mw1, 'region': _pick(rng, region_mix, n),
+        'ix_voltage': rng.choice([69.0, 115.0, 138.0, 230.0, 345.0, 500.0], size=n),
+        'diff_months_ia': ia_months, 'diff_months_cod': cod_months, 'diff_months_wd': wd_months,
+    })[DUR_COLUMNS]
+    _ensure(df, 'region', ['PJM'])
+    _ensure(df, 'q_year', [2020, 2020, 2014])
+    _ensure(df, 'q_status', list(STATUS_MIX))
+    _ensure(df, 'type_clean', ['Solar'])
+    return df
+
+
+def qmap_frame(rng, n, region_mix=REGION_MIX):
+    """geolocated queue requests, each on its county polygon"""
+    import geopandas as gpd
+
+    df = queue_frame(rng, n, region_mix)
+    names, geoms = _place(rng, df['region'].to_numpy())
+    df = df[['region', 'q_year', 'q_status', 'type_clean', 'diff_months_cod', 'mw1']].assign(NAME=names)
+    return gpd.GeoDataFrame(df, geometry=geoms.values, crs=4326)
+
+
+def cost_frame(rng, n, iso):
+    """interconnection cost sample of one ISO, in the normalized cost layout"""
+    import geopandas as gpd
+
+    poi = rng.lognormal(np.log(25), 1.0, n)
+    network = np.where(rng.random(n) < 0.35, 0.0, rng.lognormal(np.log(60), 1.4, n))
+    total = poi + network
+    # not all of the records have cost information
+    unpriced = rng.random(n) < 0.12
+    poi[unpriced] = network[unpriced] = total[unpriced] = np.nan
+    df = pd.DataFrame({
+        'q_year': _years(rng, n, 2005, 2022, 1.2), 'fuel': _pick(rng, COST_FUEL_MIX, n),
+        'request_status': _pick(rng, COST_STATUS_MIX, n),
+        'nameplate_mw': np.clip(rng.lognormal(np.log(100), 0.9, n), 1, 2000),
+        'poi_cost/kw': poi, 'network_cost/kw': network, 'total_cost/kw': total,
+    })
+    _ensure(df, 'request_status', list(COST_STATUS_MIX))
+    df.loc[0, ['q_year', 'fuel', 'request_status']] = list(COST_DEFAULTS[iso])
+    df.loc[0, ['poi_cost/kw', 'network_cost/kw', 'total_cost/kw']] = [25.0, 60.0, 85.0]
+    names, geoms = _place(rng, np.full(n, iso, dtype=object))
+    return gpd.GeoDataFrame(df.assign(NAME=names), geometry=geoms.values, crs=4326)
+
+
+def layer_frames(rng):
+    """market boundaries and a transmission sketch for the map overlays"""
+    import geopandas as gpd
+    from shapely.geometry import LineString, box
+
+    def market(region, **attrs):
+        return gpd.GeoDataFrame({'NAME': [ISO_NAMES[region]], **{k: [v] for k, v in attrs.items()}},
+                                geometry=[box(*REGION_BOUNDS[region])], crs=4326)
+
+    iso_shapes = pd.concat([market(region, PEAK_LOAD=float(rng.integers(20000, 150000)),
+                                   AVG_LOAD=float(rng.integers(10000, 90000)), YEAR=2021)
+                            for region in ISO_NAMES], ignore_index=True)
+    x0, y0, x1, y1 = REGION_BOUNDS['PJM']
+    lines = [LineString(np.column_stack([rng.uniform(x0, x1, 4), rng.uniform(y0, y1, 4)])) for _ in range(60)]
+    pjm_trans = gpd.GeoDataFrame({'VOLTAGE': rng.choice([230, 345, 500, 765], size=len(lines))},
+                                 geometry=lines, crs=4326)
+    return {'iso_shapes': iso_shapes, 'pjm_iso': market('PJM'), 'pjm_trans': pjm_trans,
+            'miso_iso': market('MISO'), 'nyiso_iso': market('NYISO')}
+
+
+def generate(rows=None, scale=1.0, region_mix=None, seed=0):
+    """write a complete synthetic store into store.DATA_DIR; returns rows written per source
+
+    rows sets the queue size directly, otherwise every source is scale times its
+    published size; the queue map and cost samples keep their published ratio to it.
+    """
+    rng = np.random.default_rng(seed)
+    region_mix = region_mix or REGION_MIX
+    if rows is not None:
+        scale = rows / BASE_ROWS['queue']
+    sizes = {name: max(int(base * scale), 10) for name, base in BASE_ROWS.items()}
+    # every input that changes the data is in the version, or caches keyed on it go stale
+    mix = hashlib.sha1(json.dumps(sorted(region_mix.items())).encode()).hexdigest()[:8]
+    version = f'synthetic-{seed}-{sizes["queue"]}-{mix}'
+
+    queue = queue_frame(rng, sizes['queue'], region_mix)
+    frames = {'trend': queue[TREND_COLUMNS].copy(), 'trend_dur': queue,
+              'qmap': qmap_frame(rng, sizes['qmap'], region_mix)}
+    for name, iso in COST_ISOS.items():
+        frames[name] = cost_frame(rng, sizes[name], iso)
+    frames.update(layer_frames(rng))
+
+    for name, df in frames.items():
+        store.put(name, df, version)
+    return {name: len(df) for name, df in frames.items()}
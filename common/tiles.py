@@ -0,0 +1,122 @@
+import os
+import shutil
+import subprocess
+
+import pandas as pd
+
+from common import assets, layers, store
+
+# Optional vector tile mode: layers are pre-built as PMTiles under static/ (served by
+# streamlit with server.enableStaticServing) and the browser fetches tiles on demand
+# instead of receiving the whole GeoJSON inline. Needs tippecanoe to build and
+# folium-pmtiles to draw; everything falls back to GeoJSON when either is missing.
+TILE_LAYERS = layers.LAYERS + ['counties']
+# store source each archive is built from; the source version is part of the file name
+TILE_SOURCES = {'counties': 'qmap'}
+
+TILE_DIR = assets.STATIC_DIR / 'tiles'
+TILE_URL = os.environ.get('IQ_TILE_URL', '/app/static/tiles')
+
+
+def enabled():
+    return os.environ.get('IQ_VECTOR_TILES') == '1'
+
+
+def tile_name(name):
+    # a refreshed source needs new tiles (county geom_ids are numbered per version)
+    return f'{name}.{store.version(TILE_SOURCES.get(name, name))}.pmtiles'
+
+
+def tile_path(name):
+    return TILE_DIR / tile_name(name)
+
+
+def available(name):
+    return enabled() and tile_path(name).exists()
+
+
+def _county_geojson():
+    # one feature per distinct county shape in the national queue map
+    path = layers.LAYER_DIR / f"counties.{store.version('qmap')}.geojson"
+    if not path.exists():
+        gdf = store.read_geo('qmap')
+        counties = gdf.drop_duplicates('geom_id')[['geom_id', 'NAME', 'geometry']].to_crs(4326)
+        with store.atomic_target(path) as tmp:
+            counties.to_file(tmp, driver='GeoJSON', COORDINATE_PRECISION=layers.COORDINATE_PRECISION)
+    return str(path)
+
+
+def build_tiles(name):
+    """build the PMTiles archive of a layer with tippecanoe"""
+    if shutil.which('tippecanoe') is None:
+        raise RuntimeError('tippecanoe is required to build vector tiles')
+    source = _county_geojson() if name == 'counties' else layers.layer_for_zoom(name, float('inf'))
+    TILE_DIR.mkdir(parents=True, exist_ok=True)
+    subprocess.run(['tippecanoe', '-o', str(tile_path(name)), '-l', name, '-zg',
+                    '--drop-densest-as-needed', '--force', source], check=True)
+
+
+def _color(value):
+    return '#' + value.lstrip('#')
+
+
+def maplibre_style(name, style, where=None, fill_color=None):
+    """MapLibre style for a PMTiles layer, from the leaflet path style used by the GeoJSON layers
+
+    where optionally limits the features drawn, e.g. {'NAME': ['PJM INTERCONNECTION, LLC']};
+    fill_color optionally replaces the fill with a MapLibre expression.
+    """
+    source = {'type': 'vector', 'url': f'pmtiles://{TILE_URL}/{tile_name(name)}'}
+    conditions = [['in', prop] + list(values) for prop, values in (where or {}).items()]
+    fill = {'id': f'{name}-fill', 'type': 'fill', 'source': name, 'source-layer': name,
+            'filter': ['all', ['==', '$type', 'Polygon']] + conditions,
+            'paint': {'fill-color': fill_color or _color(style.get('fillColor', style.get('color', '#3388ff'))),
+                      'fill-opacity': style.get('fillOpacity', 0.2)}}
+    line = {'id': f'{name}-line', 'type': 'line', 'source': name, 'source-layer': name,
+            'paint': {'line-color': _color(style.get('color', '#3388ff')),
+                      'line-width': style.get('weight', 1),
+                      'line-opacity': style.get('opacity', 1)}}
+    if conditions:
+        line['filter'] = ['all'] + conditions
+    return {'version': 8, 'sources': {name: source}, 'layers': [fill, line]}
+
+
+def add_layer(m, name, layer_name, zoom, style, hover_style=None, show=True, where=None):
+    """add a boundary/transmission layer as vector tiles when built, else as simplified GeoJSON"""
+    if available(name):
+        from folium_pmtiles.vector import PMTilesMapLibreLayer
+
+        PMTilesMapLibreLayer(f'{TILE_URL}/{tile_name(name)}', layer_name,
+                             style=maplibre_style(name, style, where), overlay=True, show=show).add_to(m)
+        return
+    m.add_geojson(layers.layer_for_zoom(name, zoom),
+                  layer_name=layer_name,
+                  style=style,
+                  hover_style=hover_style or {},
+                  show=show)
+
+
+def add_choropleth(m, name, layer_name, key, values, bins, fill_color='YlOrRd', fill_opacity=0.6,
+                   line_opacity=0.5, nan_fill_color='black', legend_name=''):
+    """the vector tile counterpart of folium.Choropleth, for a layer built with tiles
+
+    values is indexed by the `key` property of the features; only those features are
+    drawn, and the page sends one color per feature instead of its geometry.
+    """
+    from branca.colormap import StepColormap
+    from branca.utilities import color_brewer
+    from folium_pmtiles.vector import PMTilesMapLibreLayer
+
+    if values.empty:
+        return
+    colormap = StepColormap(color_brewer(fill_color, n=len(bins) - 1), index=bins,
+                            vmin=bins[0], vmax=bins[-1], caption=legend_name)
+    ids = [int(i) for i in values.index]
+    match = ['match', ['get', key]]
+    for i, value in zip(ids, values):
+        match += [i, nan_fill_color if pd.isna(value) else colormap.rgb_hex_str(value)]
+    style = {'fillOpacity': fill_opacity, 'opacity': line_opacity, 'color': '#000000', 'weight': 1}
+    PMTilesMapLibreLayer(f'{TILE_URL}/{tile_name(name)}', layer_name, overlay=True,
+                         style=maplibre_style(name, style, where={key: ids},
+                                              fill_color=match + [nan_fill_color])).add_to(m)
+    colormap.add_to(m)
@@ -0,0 +1,235 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import streamlit as st
+
+from common import store
+
+# Per-stage timings of every rerun: wall time, rows processed and payload bytes.
+#   IQ_DEBUG=1 (or ?debug=1 in the url)  table of the last rerun in the sidebar
+#   IQ_TIMING_LOG=path                   one json line per stage appended to path
+#   IQ_METRICS_PORT=port                 prometheus text format on http://localhost:port/metrics
+#                                        for all workers on the host (see METRICS_DIR)
+# The panel and the endpoint also report the process's result and map html caches.
+# With none of them set a stage costs two perf_counter calls and a list append.
+TIMING_LOG = os.environ.get('IQ_TIMING_LOG')
+METRICS_PORT = os.environ.get('IQ_METRICS_PORT')
+# each worker writes its totals here every FLUSH_SECONDS; the one holding the port
+# serves the sum, and another takes the port over when that worker goes away
+METRICS_DIR = store.DATA_DIR / 'metrics'
+FLUSH_SECONDS = 5
+
+STAGE_FIELDS = ['runs', 'seconds', 'rows', 'bytes']
+CACHE_FIELDS = ['entries', 'bytes', 'hits', 'misses', 'evictions']
+# point-in-time cache fields, only reported for workers that are still running
+CACHE_GAUGES = ['entries', 'bytes']
+
+logger = logging.getLogger(__name__)
+
+_log_lock = threading.Lock()
+
+
+class Stage:
+    def __init__(self, name, rows=None, nbytes=None):
+        self.name = name
+        self.rows = rows
+        self.nbytes = nbytes
+        self.seconds = None
+
+
+class Registry:
+    """running totals per (page, stage) for the metrics endpoint"""
+
+    def __init__(self):
+        self.totals = defaultdict(lambda: dict.fromkeys(STAGE_FIELDS, 0))
+        self._lock = threading.Lock()
+
+    def add(self, page, stage):
+        with self._lock:
+            total = self.totals[page, stage.name]
+            total['runs'] += 1
+            total['seconds'] += stage.seconds
+            total['rows'] += stage.rows or 0
+            total['bytes'] += stage.nbytes or 0
+
+    def snapshot(self):
+        with self._lock:
+            stages = [{'page': page, 'stage': name, **total} for (page, name), total in self.totals.items()]
+        return {'pid': os.getpid(), 'stages': stages, 'caches': cache_stats()}
+
+    def flush(self):
+        with store.atomic_target(METRICS_DIR / f'{os.getpid()}.json') as tmp:
+            with open(tmp, 'w') as f:
+                json.dump(self.snapshot(), f)
+
+    def prometheus(self):
+        stages = defaultdict(lambda: dict.fromkeys(STAGE_FIELDS, 0))
+        caches = defaultdict(lambda: dict.fromkeys(CACHE_FIELDS, 0))
+        for snapshot in _snapshots(self.snapshot()):
+            for total in snapshot['stages']:
+                for field in STAGE_FIELDS:
+                    stages[total['page'], total['stage']][field] += total[field]
+            alive = _alive(snapshot['pid'])
+            for name, stats in snapshot['caches'].items():
+                for field in CACHE_FIELDS:
+                    if alive or field not in CACHE_GAUGES:
+                        caches[name][field] += stats[field]
+        lines = []
+        for metric, field, help_text in [('iq_stage_runs_total', 'runs', 'stage executions'),
+                                         ('iq_stage_seconds_total', 'seconds', 'wall time spent in the stage'),
+                                         ('iq_stage_rows_total', 'rows', 'rows processed by the stage'),
+                                         ('iq_stage_bytes_total', 'bytes', 'payload bytes emitted by the stage')]:
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} counter']
+            for (page, name), total in sorted(stages.items()):
+                lines.append(f'{metric}{{page="{page}",stage="{name}"}} {total[field]}')
+        for metric, field, kind, help_text in [('iq_cache_entries', 'entries', 'gauge', 'entries held'),
+                                               ('iq_cache_bytes', 'bytes', 'gauge', 'bytes held'),
+                                               ('iq_cache_hits_total', 'hits', 'counter', 'lookups served'),
+                                               ('iq_cache_misses_total', 'misses', 'counter', 'lookups not served'),
+                                               ('iq_cache_evictions_total', 'evictions', 'counter', 'entries evicted')]:
+            lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} {kind}']
+            for name, stats in sorted(caches.items()):
+                lines.append(f'{metric}{{cache="{name}"}} {stats[field]}')
+        return '\n'.join(lines) + '\n'
+
+
+def _snapshots(own):
+    # every worker's last flush, with this process's live totals in place of its file;
+    # counters of workers that exited stay in, as with prometheus_client's multiprocess mode
+    snapshots = [own]
+    for path in METRICS_DIR.glob('*.json'):
+        if path.stem == str(own['pid']):
+            continue
+        try:
+            snapshots.append(json.loads(path.read_text()))
+        except (FileNotFoundError, ValueError):
+            continue
+    return snapshots
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def cache_stats():
+    """stats of the process-wide caches, by name"""
+    # imported here: neither module is needed to time a stage
+    from common import query, render
+
+    return {'results': query.cache_stats(), 'render': render.cache_stats()}
+
+
+@st.cache_resource
+def registry():
+    reg = Registry()
+    if METRICS_PORT:
+        threading.Thread(target=_run_metrics, args=(reg, int(METRICS_PORT)),
+                         name='iq-metrics-flush', daemon=True).start()
+    return reg
+
+
+def _handler(reg):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != '/metrics':
+                self.send_error(404)
+                return
+            body = reg.prometheus().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def _bind(reg, port):
+    try:
+        server = ThreadingHTTPServer(('127.0.0.1', port), _handler(reg))
+    except OSError:
+        return None
+    threading.Thread(target=server.serve_forever, name='iq-metrics', daemon=True).start()
+    logger.info('serving metrics of every worker on port %d', port)
+    return server
+
+
+def _run_metrics(reg, port):
+    server = None
+    while True:
+        if server is None:
+            # held by another worker until it exits
+            server = _bind(reg, port)
+        try:
+            reg.flush()
+        except OSError as e:
+            logger.warning('could not write metrics to %s: %s', METRICS_DIR, e)
+        time.sleep(FLUSH_SECONDS)
+
+
+def page(name):
+    """start the timings of a rerun; call once at the top of a page"""
+    st.session_state['_timing_page'] = name
+    st.session_state['_timings'] = []
+
+
+def _write_log(page_name, stage):
+    line = json.dumps({'ts': time.time(), 'page': page_name, 'stage': stage.name,
+                       'seconds': round(stage.seconds, 6), 'rows': stage.rows, 'bytes': stage.nbytes})
+    with _log_lock, open(TIMING_LOG, 'a') as f:
+        f.write(line + '\n')
+
+
+@contextmanager
+def stage(name, rows=None, nbytes=None):
+    """time a block; set .rows and .nbytes on the yielded stage once they are known"""
+    current = Stage(name, rows, nbytes)
+    start = time.perf_counter()
+    try:
+        yield current
+    finally:
+        current.seconds = time.perf_counter() - start
+        page_name = st.session_state.get('_timing_page', '')
+        st.session_state.setdefault('_timings', []).append(current)
+        registry().add(page_name, current)
+        if TIMING_LOG:
+            _write_log(page_name, current)
+
+
+def debug():
+    return os.environ.get('IQ_DEBUG') == '1' or st.query_params.get('debug') == '1'
+
+
+def recording():
+    """whether anything reads the stages; for measurements that cost more than a len()"""
+    return bool(TIMING_LOG or METRICS_PORT) or debug()
+
+
+def panel():
+    """sidebar table of this rerun's stages, in debug mode; call at the end of a page"""
+    if not debug():
+        return
+    stages = st.session_state.get('_timings', [])
+    df = pd.DataFrame([{'stage': s.name, 'ms': round(s.seconds * 1000, 1), 'rows': s.rows, 'bytes': s.nbytes}
+                       for s in stages], columns=['stage', 'ms', 'rows', 'bytes'])
+    caches = pd.DataFrame.from_dict(cache_stats(), orient='index').rename_axis('cache').reset_index()
+    with st.sidebar.expander('Timings', expanded=True):
+        st.dataframe(df, hide_index=True, use_container_width=True)
+        st.caption(f"{df['ms'].sum():.1f} ms in {len(df)} stages")
+        st.dataframe(caches, hide_index=True, use_container_width=True)
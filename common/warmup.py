@@ -0,0 +1,34 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from common import layers, qmap_data, store
+
+
+def _warm(name):
+    # fetch a source, then build whatever the pages derive from it on first view
+    store.sync(name)
+    if name == 'qmap':
+        qmap_data.build_shards()
+    if name in layers.LAYERS:
+        layers.build_tiers(name)
+
+
+def warmup(workers=8):
+    """fill the local store for every page concurrently; returns the names that failed
+
+    Run before the server starts so the first visitor after a deploy reads local
+    parquet instead of waiting on downloads. A failure is reported and left for
+    the page to retry rather than blocking startup.
+    """
+    names = list(store.SOURCES) + list(store.GEO_SOURCES)
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_warm, name): name for name in names}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                future.result()
+            except Exception as e:
+                failed.append(name)
+                print(f'warmup: {name} failed: {e}')
+    return failed
+
@@ -1,9 +1,10 @@
-import pandas as pd
 import altair as alt
 import streamlit as st
 from matplotlib import pyplot as plt
 import matplotlib.style as style
 
+from common import assets, query, store, timing
+
 style.use('fivethirtyeight')
 plt.rcParams['lines.linewidth'] = 1
 dpi = 1000
@@ -24,6 +25,7 @@ st.set_page_config(page_title="Queued Up  ⚡",
                    page_icon='📈',
                    layout="wide")
 
+timing.page('Queued Up')
 st.title("Queued Up  ⚡ ")
 
 mkdwn_analysis = """
@@ -35,11 +37,6 @@ mkdwn_analysis = """
 
 st.sidebar.info(mkdwn_analysis)
 
-link_prefix = "https://raw.githubusercontent.com/kman2022/data/main/main/"
-csv_trend = link_prefix + "berkley/df_trend.csv"
-csv_duration = link_prefix + "berkley/df_trend_dur.csv"
-csv_q_hist = link_prefix + "berkley/df_iq_clean.csv"
-
 FUEL_LIST = ['Gas', 'Wind', 'Hydro', 'Solar', 'Other', 'Geothermal',
              'Other Storage', 'Nuclear', 'Wind+Battery', 'Solar+Battery',
              'Gas+Battery', 'Solar+Wind', 'Gas+Solar', 'Solar+Gas', 'Battery',
@@ -49,38 +46,88 @@ REGION_LIST = ['CAISO', 'ISO-NE', 'MISO', 'PJM', 'NYISO', 'SPP', 'ERCOT',
                'Southeast (non-ISO)', 'West (non-ISO)']
 
 
-@st.cache_data(persist=True)
-def load_q_data():
-    # trend
-    df_trend = pd.read_csv(csv_trend, usecols=['q_year', 'q_status', 'cod_year', 'type_clean', 'mw1', 'region'])
-    # duration
-    df_dur = pd.read_csv(csv_duration, usecols=['q_year', 'q_status', 'cod_year', 'type_clean', 'mw1',
-                                                'region', 'ix_voltage', 'diff_months_ia', 'diff_months_cod',
-                                                'diff_months_wd'])
-    # history
-    df_hist = pd.read_csv(csv_duration)
-    return df_trend, df_dur, df_hist
+# duration columns shown as raw data
+DUR_COLUMNS = ['q_year', 'q_status', 'cod_year', 'type_clean', 'mw1', 'region', 'ix_voltage', 'diff_months_ia',
+               'diff_months_cod', 'diff_months_wd']
 
-# Load data
-df_trend, df_dur, df_hist = load_q_data()
+# both sources are fetched in parallel on a cold store
+with timing.stage('fetch'):
+    assets.fetch((), ('trend', 'trend_dur'))
+
+# Queries run against the local parquet copies (see common/query.py); results are cached
+# per version of the copies so a background refresh shows up on the next rerun
+data_version = store.version('trend'), store.version('trend_dur')
 
 def unique_no_nan(x):
     return x.dropna().unique()
 
-@st.cache_data(persist=True)
-def regions(df):
-    region_list = list(unique_no_nan(df['region']))
+def regions():
+    # from the store's value index; the full history file is never loaded for nine labels
+    region_list = store.values('trend_dur', 'region')
     default_region = region_list.index('PJM')
     return region_list, default_region
 
-@st.cache_data(persist=True)
-def filter_data(df, yr, ft, loc):
-    df = df.iloc[:, :9]
-    df = df[df['q_year'] == yr]
+def filter_data(yr, ft, loc):
+    # first nine duration columns, as df.iloc[:, :9] did; query.select caches per version and filters
+    columns = store.column_order('trend_dur', DUR_COLUMNS)[:9]
+    where = [('q_year', '==', yr), ('region', '==', loc)]
     if ft:
-        df = df[df['type_clean'].isin(ft)]
-    df = df[df['region'] == loc]
-    return df
+        where.append(('type_clean', 'in', ft))
+    return query.select('trend_dur', columns, where)
+
+def completion_cube():
+    # counts and MW per region x status x q_year x cod_year; the overview tables are slices of it
+    return query.aggregate('trend', ['region', 'q_status', 'q_year', 'cod_year'],
+                           {'n': ('mw1', 'size'), 'mw1_n': ('mw1', 'count'), 'mw1': ('mw1', 'sum')}, dropna=False)
+
+@st.cache_data(max_entries=1)
+def overview_tables(version):
+    cube = completion_cube()
+
+    # completion by region, queued 2000-2015
+    df_tr = cube[(cube['q_year'] >= 2000) & (cube['q_year'] <= 2015)]
+    reg_status_count = df_tr.groupby(['region', 'q_status'], observed=True)[['n']].sum()
+    reg_status_count_tot = df_tr[df_tr['q_status'].notna()].groupby(['region'], observed=True)[['n']].sum()
+    reg_perc_count = (reg_status_count.div(reg_status_count_tot, level=0) * 100).rename(columns={'n': 'q_status'})
+
+    reg_status_volume = cube.groupby(['region', 'q_status'], observed=True)[['mw1']].sum()
+    reg_status_volume_tot = cube.groupby(['region'], observed=True)[['mw1']].sum()
+    reg_perc_volume = reg_status_volume.div(reg_status_volume_tot, level=0) * 100
+
+    def_cod = cube[(cube['q_year'] >= 2000) & (cube['q_year'] <= 2016) & (cube['cod_year'] <= 2021) & (
+            cube['cod_year'] >= 2000)]
+
+    def_cod_count_yr = def_cod.groupby(['cod_year', 'q_status'], observed=True)[['n']].sum()  # 27%
+    def_cod_count_tot_yr = def_cod[def_cod['q_status'].notna()].groupby(['cod_year'])[['n']].sum()
+    def_perc_cod_count_yr = (def_cod_count_yr.div(def_cod_count_tot_yr, level=0) * 100).rename(
+        columns={'n': 'q_status'})
+
+    # How the 27% claim evolved overall
+    def_perc_cod_trend = def_perc_cod_count_yr[def_perc_cod_count_yr.index.isin(['operational'], level=1)]
+
+    # How the 27% claim evolved by region / needed to subset by mw1 b/c status in the index
+    operational = def_cod[def_cod['q_status'] == 'operational']
+    def_reg_count_yr = operational.groupby(['cod_year', 'region', 'q_status'], observed=True)[['mw1_n']].sum()
+    def_reg_count_tot_yr = operational.groupby(['cod_year', 'q_status'], observed=True)[['mw1_n']].sum()
+    def_reg_count_yr = def_reg_count_yr.rename(columns={'mw1_n': 'mw1'}).reset_index()
+    def_reg_count_yr = def_reg_count_yr.set_index(['cod_year', 'q_status'])
+    df_reg_perc_cod_tot = def_reg_count_yr.join(def_reg_count_tot_yr.rename(columns={'mw1_n': 'mw1'}),
+                                                lsuffix='_r', rsuffix='_t')
+    df_reg_perc_cod_tot['perc'] = df_reg_perc_cod_tot.mw1_r / df_reg_perc_cod_tot.mw1_t
+
+    return reg_perc_count, reg_perc_volume, def_perc_cod_trend, df_reg_perc_cod_tot
+
+def chart_trend(region, ft, qyear):
+    # one row per (q_year, q_status) so the charts receive totals instead of every project
+    # vega-lite's count(mw1) counted every record and drew the null status group too
+    return query.aggregate('trend', ['q_year', 'q_status'], {'mw1_sum': ('mw1', 'sum'), 'mw1_count': ('mw1', 'size')},
+                           where=[('region', '==', region), ('type_clean', 'in', ft), ('q_year', '>=', qyear)],
+                           dropna=False)
+
+def duration_trend():
+    return query.aggregate('trend_dur', ['q_year'], {'diff_months_cod': ('diff_months_cod', 'mean'),
+                                                     'mw1': ('mw1', 'sum')},
+                           where=[('q_year', '>', 2008)]).set_index('q_year')
 
 def status_types(df):
     status_list = list(unique_no_nan(df['q_status']))
@@ -111,7 +158,7 @@ def app():
     # Toggles
     row1_col1, row1_col2 = st.columns([3.0, 3.4])
     # Load regions
-    region_list, default_region = regions(df_hist)
+    region_list, default_region = regions()
 
     with row1_col1:
         # on the first run add variables to track in state
@@ -157,10 +204,9 @@ def app():
     with st.expander("See chart trend by volume"):
         row3_col1, row3_col2 = st.columns([5, 1])
     with row3_col1:
-        df_chart_trend = df_trend[
-            (df_trend['region'] == region_select) & (df_trend['type_clean'].isin(selected_options_ft)) & (
-                    df_trend['q_year'] >= qyear_select)]
-        df_chart_trend = df_chart_trend[['q_year', 'q_status', 'mw1']]
+        with timing.stage('chart_trend') as t:
+            df_chart_trend = chart_trend(region_select, selected_options_ft, qyear_select)
+            t.rows = len(df_chart_trend)
 
         bar_chart = alt.Chart(
             df_chart_trend,
@@ -170,7 +216,7 @@ def app():
             cornerRadiusTopRight=3
         ).encode(
             x=alt.X('q_year:O', title="Year"),
-            y=alt.Y('sum(mw1):Q', title="Capapcity"),
+            y=alt.Y('mw1_sum:Q', title="Capapcity"),
             color='q_status:N'
         )
 
@@ -188,7 +234,7 @@ def app():
             cornerRadiusTopRight=3
         ).encode(
             x=alt.X('q_year:O', title="Year"),
-            y=alt.Y('count(mw1):Q', title="Count"),
+            y=alt.Y('mw1_count:Q', title="Count"),
             color='q_status:N'
         )
 
@@ -206,22 +252,14 @@ def app():
             cornerRadiusTopRight=3
         ).encode(
             x=alt.X('q_year:O', title="Year"),
-            y=alt.Y('count(mw1):Q', title="Count", stack='normalize'),
+            y=alt.Y('mw1_count:Q', title="Count", stack='normalize'),
             color='q_status:N'
         )
 
         st.altair_chart(bar_chart, theme="streamlit", use_container_width=True)
 
-    df_tr = df_trend[['q_year', 'q_status', 'mw1', 'region']]
-    df_tr = df_tr[(df_tr['q_year'] >= 2000) & (df_tr['q_year'] <= 2015)]
-
-    reg_status_count = df_tr.groupby(['region', 'q_status']).agg({'q_status': 'count'}, group_keys=False)
-    reg_status_count_tot = df_tr.groupby(['region']).agg({'q_status': 'count'}, group_keys=False)
-    reg_perc_count = reg_status_count.div(reg_status_count_tot, level=0) * 100
-
-    reg_status_volume = df_trend.groupby(['region', 'q_status']).agg({'mw1': 'sum'}, group_keys=False)
-    reg_status_volume_tot = df_trend.groupby(['region']).agg({'mw1': 'sum'}, group_keys=False)
-    reg_perc_volume = reg_status_volume.div(reg_status_volume_tot, level=0) * 100
+    with timing.stage('overview'):
+        reg_perc_count, reg_perc_volume, def_perc_cod_trend, df_reg_perc_cod_tot = overview_tables(data_version)
 
     st.header('Overview')
     st.subheader('Trends:')
@@ -258,27 +296,6 @@ def app():
         'year-end 2021. (see pg. 2 PJM Cost Report)')
     st.info('- While unable to tie out the number exactly it misses the trend and wide variation between markets 📈')
 
-    df_tr1 = df_trend[['q_year', 'cod_year', 'q_status', 'mw1', 'region']]
-    def_cod = df_tr1[(df_tr1['q_year'] >= 2000) & (df_tr1['q_year'] <= 2016) & (df_tr1['cod_year'] <= 2021) & (
-            df_tr1['cod_year'] >= 2000)]
-
-    def_cod_count_yr = def_cod.groupby(['cod_year', 'q_status']).agg({'q_status': 'count'})  # 27%
-    def_cod_count_tot_yr = def_cod.groupby(['cod_year']).agg({'q_status': 'count'})
-    def_perc_cod_count_yr = def_cod_count_yr.div(def_cod_count_tot_yr, level=0) * 100
-
-    # How the 27% claim evolved overall
-    def_perc_cod_trend = def_perc_cod_count_yr[def_perc_cod_count_yr.index.isin(['operational'], level=1)]
-
-    # How the 27% claim evolved by region / needed to subset by mw1 b/c status in the index
-    def_reg_count_yr = def_cod.groupby(['cod_year', 'region', 'q_status']).agg({'mw1': 'count'})
-    def_reg_count_yr = def_reg_count_yr[def_reg_count_yr.index.get_level_values(2).isin(['operational'])]
-    def_reg_count_tot_yr = def_cod.groupby(['cod_year', 'q_status']).agg({'mw1': 'count'})
-    def_reg_count_tot_yr = def_reg_count_tot_yr[def_reg_count_tot_yr.index.get_level_values(1).isin(['operational'])]
-    def_reg_count_yr = def_reg_count_yr.reset_index()
-    def_reg_count_yr = def_reg_count_yr.set_index(['cod_year', 'q_status'])
-    df_reg_perc_cod_tot = def_reg_count_yr.join(def_reg_count_tot_yr, lsuffix='_r', rsuffix='_t')
-    df_reg_perc_cod_tot['perc'] = df_reg_perc_cod_tot.mw1_r / df_reg_perc_cod_tot.mw1_t
-
     #############
     with st.expander("See tabular operational trend"):
         st.code(""" # reference the 24% completion figure
@@ -320,9 +337,9 @@ def app():
     st.subheader('Duration:')
     st.markdown('- The duration from Interconnection Request (IR) to COD is increasing, averaging ~4 years since 2016.')
 
-    chart_dur = df_dur[['q_year', 'mw1', 'diff_months_cod']]
-    chart_dur = chart_dur[chart_dur['q_year'] > 2008]
-    chart_dur_vol = chart_dur.groupby('q_year').agg({'diff_months_cod': 'mean', 'mw1': 'sum'})
+    with timing.stage('duration_trend') as t:
+        chart_dur_vol = duration_trend()
+        t.rows = len(chart_dur_vol)
 
     #############
     with st.expander("See chart IR to COD"):
@@ -337,9 +354,11 @@ def app():
         row11_col1, row11_col2 = st.columns([5, 1])
         row11_col1.bar_chart(volume)
 
-    # raw queue data filter_data(df, yr, ft, loc)
+    # raw queue data filter_data(yr, ft, loc)
     st.subheader("Historical Data")
-    raw_trend_data = filter_data(df_dur, qyear_select, selected_options_ft, region_select)
+    with timing.stage('filter') as t:
+        raw_trend_data = filter_data(qyear_select, selected_options_ft, region_select)
+        t.rows = len(raw_trend_data)
     if st.checkbox("Show Raw Trend Queue Data", False, help='Displays the raw data based on filters.'):
         st.subheader('Raw Queue Data')
         st.write(raw_trend_data)
@@ -355,3 +374,4 @@ def app():
 
 
 app()
+timing.panel()
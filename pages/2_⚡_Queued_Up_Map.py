@@ -1,17 +1,17 @@
-import geopandas as gpd
 import streamlit as st
 import folium
 from streamlit_folium import st_folium
 from folium.plugins import Draw
 
+from common import assets, layers, qmap_data, store, tiles, timing
+
 # todo need to remap projects as CA does not display in the geojson
-# todo rerun figures for map 1 file per market in order to speed up the map
 # todo use file in doc/streamlit/data file as manual adjustments were made to several hundred plants
 # todo add height or increased weight on borders for volume
 # todo are connection times higher in the border regions where must coordinate with adjoining tso?
 
 st.set_page_config(page_title="Queued Up Map ⚡",
-                   page_icon='https://i.imgur.com/UbOXYAU.png',
+                   page_icon=assets.bundled('https://i.imgur.com/UbOXYAU.png'),
                    layout="wide")
 
 st.title("Queued Up Map ⚡ ")
@@ -21,13 +21,12 @@ Plants Seeking Transmission InterconnectionAs of the End of 2021. Joseph Rand, W
 Andrew Mills, Joachim Seel, Ryan Wiser Lawrence Berkeley National Laboratory. February 2022."""
 
 st.sidebar.info(mkdwn_analysis)
+timing.page('Queued Up Map')
 logo = "https://i.imgur.com/UbOXYAU.png"
-st.sidebar.image(logo)
-
-link_prefix = "https://raw.githubusercontent.com/kman2022/data/main/main/"
-csv_q_hist = link_prefix + "berkley/df_iq_clean.csv"
-gj_iq_geo = link_prefix + "berkley/gdp_iq_qeo.geojson"
-sh_iso_geo = link_prefix + "berkley/geojson_iso.json"  # 19,689/24,381
+# the logo and this page's data are fetched in one parallel round
+with timing.stage('fetch'):
+    local = assets.fetch((logo,), ('qmap', 'iso_shapes'))
+assets.image(st.sidebar, local[logo])
 
 REGION_LIST = ['CAISO', 'ISO-NE', 'MISO', 'PJM', 'NYISO', 'SPP', 'ERCOT',
                'Southeast (non-ISO)', 'West (non-ISO)']
@@ -43,22 +42,34 @@ REGION_MAP = {'CALIFORNIA INDEPENDENT SYSTEM OPERATOR': 'CAISO',
 MAP_ZOOM = 6
 
 
-@st.cache_data(persist=True)
-def load_qmap_data():
-    # geoloc hist
-    gdf_hist = gpd.read_file(gj_iq_geo)
-    # geoloc shape
-    gdf_iso = gpd.read_file(sh_iso_geo)
-    gdf_iso['region'] = gdf_iso['NAME'].map(REGION_MAP)
-    return gdf_hist, gdf_iso
+@st.cache_data(max_entries=1)
+def load_qmap_options(version):
+    # widget options for every region, from the shard manifest
+    return qmap_data.load_options()
 
 
-def unique_no_nan(x):
-    return x.dropna().unique()
+# geometry frames are shared read-only across reruns and sessions instead of unpickled
+# on every rerun, as in cost_data; filter into new frames, never modify them in place
+@st.cache_resource(max_entries=len(REGION_LIST))
+def load_qmap_region(region, version):
+    # geoloc hist, one region shard
+    gdf_hist = qmap_data.read_region(region)
+    # county shapes are kept once; the project table only carries their geom_id
+    county_geoms = qmap_data.county_geometries(gdf_hist)
+    gdf_hist = gdf_hist.drop(columns='geometry')
+    return gdf_hist, county_geoms
+
+
+@st.cache_resource(max_entries=1)
+def load_iso_shapes(version):
+    # geoloc shape, simplified for the initial map zoom
+    gdf_iso = layers.read_layer('iso_shapes', MAP_ZOOM)  # 19,689/24,381
+    gdf_iso['region'] = gdf_iso['NAME'].map(REGION_MAP)
+    return gdf_iso
 
 
-def filter_regions(df):
-    region_list = list(unique_no_nan(df['region']))
+def filter_regions(options):
+    region_list = options['region']
     default_region = region_list.index('PJM')
     region_select = st.selectbox('Region:',
                                  region_list, index=default_region,
@@ -66,8 +77,8 @@ def filter_regions(df):
     return region_select, default_region
 
 
-def filter_status(df):
-    status_list = list(unique_no_nan(df['q_status']))
+def filter_status(options):
+    status_list = options['q_status']
     default_st = status_list.index('active')
     status_type = st.selectbox('Status:',
                                status_list, index=default_st,
@@ -75,9 +86,8 @@ def filter_status(df):
     return status_type
 
 
-def filter_year(df):
-    year_list = df['q_year'].sort_values(ascending=False, na_position='last')
-    year_list = list(unique_no_nan(year_list))
+def filter_year(options):
+    year_list = sorted(options['q_year'], reverse=True)
     default_yr = year_list.index(2020)
     select_yr = st.selectbox('Year entered queue:',
                              year_list, index=default_yr,
@@ -85,8 +95,8 @@ def filter_year(df):
     return select_yr
 
 
-def filter_fuel(df):
-    fuel_list = list(unique_no_nan(df['type_clean']))
+def filter_fuel(options):
+    fuel_list = options['type_clean']
     default_ft = fuel_list.index('Solar')
     select_fuel = st.selectbox('Fuel:',
                                fuel_list, index=default_ft,
@@ -97,7 +107,11 @@ def filter_fuel(df):
 #
 # Load data
 #
-gdf_hist, gdf_iso = load_qmap_data()
+# cached per version of the local data, so a background refresh shows up on the next rerun
+with timing.stage('load') as t:
+    qmap_options = load_qmap_options(store.version('qmap'))
+    gdf_iso = load_iso_shapes(store.version('iso_shapes'))
+    t.rows = len(gdf_iso)
 
 
 def main():
@@ -109,90 +123,115 @@ def main():
     # Load year
     #
     with row1_col1:
-        select_year = filter_year(gdf_hist)
+        select_year = filter_year(qmap_options)
     #
     # Load status
     #
     with row1_col2:
-        status_type = filter_status(gdf_hist)
+        status_type = filter_status(qmap_options)
     #
     # Load regions
     #
     with row1_col3:
-        select_region, default_region = filter_regions(gdf_hist)
+        select_region, default_region = filter_regions(qmap_options)
 
     row2_col1, row2_col2, row2_col3 = st.columns([3.0, 3.0, 3.4])
     #
     # Load fuel type
     #
     with row2_col1:
-        select_fuel = filter_fuel(gdf_hist)
+        select_fuel = filter_fuel(qmap_options)
 
     row3_col1, row3_col2 = st.columns([3, 3.4])
     row4_col1, row4_col2 = st.columns([19, 1])
 
     with row4_col1:
         # filter_data(df, yr, ft, loc)
-        gdf = gdf_hist
-        gdf_iso_sel = gdf_iso
-        gdf = gdf[gdf['q_year'] == select_year]
-        gdf = gdf[gdf['type_clean'] == select_fuel]
-        gdf = gdf[gdf['region'] == select_region]
-        gdf_iso_sel = gdf_iso[gdf_iso['region'] == select_region]
-        gdf = gdf[gdf['q_status'] == status_type]
-        gdf_short = gdf[['NAME', 'diff_months_cod', 'mw1', 'geometry']]
-
-        gdf_agg = gdf_short.dissolve(by='NAME', aggfunc={'diff_months_cod': 'mean', 'mw1': 'sum'}, as_index=False)
-        gdf_geo = gdf_agg[['NAME', 'diff_months_cod', 'mw1', 'geometry']]
-
-        map_lat = gdf_iso_sel.centroid.y.mean()
-        map_lon = gdf_iso_sel.centroid.x
-        gdf_iso_sel.to_crs("EPSG:4326")
-        gdf_geo.to_crs("EPSG:4326")
-
-        map = folium.Map(location=[map_lat, map_lon],
-                         zoom_start=MAP_ZOOM,
-                         control_scale=True,
-                         tiles='CartoDB Positron',
-                         attr='<a href="TBD">TBD</a>')
-
-        Draw(export=True).add_to(map)
-        folium.GeoJson(data=gdf_iso_sel, name='Market areas',
-                       tooltip=folium.GeoJsonTooltip(fields=['region', 'PEAK_LOAD', 'AVG_LOAD', 'YEAR'], labels=True),
-                       style_function=lambda feature: {'fillOpacity': 0.3, 'weight': 0.2}
-                       ).add_to(map)
-
-        cp = folium.Choropleth(
-            geo_data=gdf_geo,
-            name="Counties",
-            data=gdf_geo,
-            columns=["NAME", "diff_months_cod", "mw1"],
-            key_on="properties.NAME",
-            fill=True,
-            fill_color="YlOrRd",
-            fill_opacity=0.6,
-            line_opacity=0.5,
-            highlight=True,
-            edgecolor='k',
-            bins=list(gdf_geo['diff_months_cod'].quantile([0, 0.25, .5, .75, 1])),
-            legend_name="Duration in months"
-        )
-        cp.add_to(map)
-        feature = folium.features.GeoJson(gdf_geo,
-                                          name='NAME',
-                                          tooltip=folium.GeoJsonTooltip(fields=["NAME", "diff_months_cod", "mw1"],
-                                                                        aliases=["County: ", "Avg. duration: ",
-                                                                                 "Sum capacity: "],
-                                                                        labels=True,
-                                                                        localize=True,
-                                                                        style=(
-                                                                            "background-color: white; color: "
-                                                                            "black;font-family:arial, padding: 10px;")))
-
-        cp.add_child(feature)
-
-        folium.LayerControl().add_to(map)
-        row4_col1 = st_folium(map, width=750)
+        with timing.stage('load_region') as t:
+            gdf, county_geoms = load_qmap_region(select_region, store.version('qmap'))
+            t.rows = len(gdf)
+        with timing.stage('filter') as t:
+            gdf = gdf[gdf['q_year'] == select_year]
+            gdf = gdf[gdf['type_clean'] == select_fuel]
+            gdf_iso_sel = gdf_iso[gdf_iso['region'] == select_region]
+            gdf = gdf[gdf['q_status'] == status_type]
+            gdf_short = gdf[['NAME', 'diff_months_cod', 'mw1', 'geom_id']]
+            t.rows = len(gdf_short)
+
+        with timing.stage('dissolve') as t:
+            gdf_geo = qmap_data.aggregate_counties(gdf_short, county_geoms)
+            t.rows = len(gdf_geo)
+
+        with timing.stage('to_crs'):
+            map_lat = gdf_iso_sel.centroid.y.mean()
+            map_lon = gdf_iso_sel.centroid.x
+            gdf_iso_sel.to_crs("EPSG:4326")
+            gdf_geo.to_crs("EPSG:4326")
+
+        with timing.stage('build_map'):
+            map = folium.Map(location=[map_lat, map_lon],
+                             zoom_start=MAP_ZOOM,
+                             control_scale=True,
+                             tiles='CartoDB Positron',
+                             attr='<a href="TBD">TBD</a>')
+
+            Draw(export=True).add_to(map)
+            if tiles.available('iso_shapes'):
+                # vector tiles carry no tooltip; the area outline is drawn on demand
+                iso_names = [name for name, region in REGION_MAP.items() if region == select_region]
+                tiles.add_layer(map, 'iso_shapes', 'Market areas', MAP_ZOOM,
+                                style={'fillOpacity': 0.3, 'weight': 0.2}, where={'NAME': iso_names})
+            else:
+                folium.GeoJson(data=gdf_iso_sel, name='Market areas',
+                               tooltip=folium.GeoJsonTooltip(fields=['region', 'PEAK_LOAD', 'AVG_LOAD', 'YEAR'],
+                                                             labels=True),
+                               style_function=lambda feature: {'fillOpacity': 0.3, 'weight': 0.2}
+                               ).add_to(map)
+
+            bins = list(gdf_geo['diff_months_cod'].quantile([0, 0.25, .5, .75, 1]))
+            if tiles.available('counties'):
+                # county shapes come from the tiles; only a color per county is sent, no tooltip
+                shapes = gdf_short[['NAME', 'geom_id']].dropna().drop_duplicates()
+                durations = shapes.set_index('geom_id')['NAME'].map(gdf_geo.set_index('NAME')['diff_months_cod'])
+                tiles.add_choropleth(map, 'counties', 'Counties', 'geom_id', durations, bins,
+                                     fill_color="YlOrRd", fill_opacity=0.6, line_opacity=0.5,
+                                     legend_name="Duration in months")
+            else:
+                cp = folium.Choropleth(
+                    geo_data=gdf_geo,
+                    name="Counties",
+                    data=gdf_geo,
+                    columns=["NAME", "diff_months_cod", "mw1"],
+                    key_on="properties.NAME",
+                    fill=True,
+                    fill_color="YlOrRd",
+                    fill_opacity=0.6,
+                    line_opacity=0.5,
+                    highlight=True,
+                    edgecolor='k',
+                    bins=bins,
+                    legend_name="Duration in months"
+                )
+                cp.add_to(map)
+                feature = folium.features.GeoJson(gdf_geo,
+                                                  name='NAME',
+                                                  tooltip=folium.GeoJsonTooltip(fields=["NAME", "diff_months_cod", "mw1"],
+                                                                                aliases=["County: ", "Avg. duration: ",
+                                                                                         "Sum capacity: "],
+                                                                                labels=True,
+                                                                                localize=True,
+                                                                                style=(
+                                                                                    "background-color: white; color: "
+                                                                                    "black;font-family:arial, padding: 10px;")))
+
+                cp.add_child(feature)
+
+            folium.LayerControl().add_to(map)
+        # the html st_folium sends, rendered a second time only when the numbers are read
+        nbytes = len(map.get_root().render().encode()) if timing.recording() else None
+        with timing.stage('st_folium', nbytes=nbytes):
+            row4_col1 = st_folium(map, width=750)
 
 
 main()
+timing.panel()
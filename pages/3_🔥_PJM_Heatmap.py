@@ -1,11 +1,9 @@
 
-import pandas as pd
-import geopandas as gpd
 import streamlit as st
 import leafmap.foliumap as leafmap
 from folium import plugins
-import matplotlib.pyplot as plt
-import matplotlib.style as style
+
+from common import assets, charts, cost_data, heat, render, tiles, timing
 
 # to do
 # fix template to match
@@ -19,37 +17,27 @@ import matplotlib.style as style
 # imporve performance of maps
 
 st.set_page_config(page_title="PJM Costs ⚡",
-                   page_icon='https://i.imgur.com/UbOXYAU.png',
+                   page_icon=assets.bundled('https://i.imgur.com/UbOXYAU.png'),
                    layout="wide")
 
 PROCESS_IMAGE = 'https://github.com/kman2022/data/blob/main/main/berkley/IQ_study_process_small%20copy.png?raw=true'
 TRANSMISSION_IMAGE = 'https://github.com/kman2022/data/blob/main/main/berkley/transmission.png?raw=true'
 pjm_im = 'https://www.pjm.com/assets/responsive/img/pjm-logo.png'
-MAP_GEO = "https://github.com/kman2022/data/blob/main/main/berkley/gdf_pjm_cost_map_agg.geojson?raw=true"
-ISO_FILE = 'https://github.com/kman2022/data/blob/main/main/berkley/pjm.geojson?raw=true'
-TRANS_FILE = 'https://github.com/kman2022/data/blob/main/main/berkley/pjm_transmission_short.geojson?raw=true'
-
-style.use('fivethirtyeight')
-plt.rcParams['lines.linewidth'] = 1
-dpi = 1000
-plt.rcParams['font.size'] = 13
-plt.rcParams['font.family'] = 'Lato'
-plt.rcParams['axes.labelsize'] = plt.rcParams['font.size']
-plt.rcParams['axes.titlesize'] = plt.rcParams['font.size']
-plt.rcParams['legend.fontsize'] = plt.rcParams['font.size']
-plt.rcParams['xtick.labelsize'] = plt.rcParams['font.size']
-plt.rcParams['ytick.labelsize'] = plt.rcParams['font.size']
-plt.rcParams['figure.figsize'] = 8, 8
+MAP_ZOOM = 7
 
 
 mkdwn_analysis = """
     **Source:** [Generator Interconnection Costs to the Transmission System:](https://emp.lbl.gov/interconnection_costs) Data for PJM Territory through 2022. Joachim Seel, Joseph Rand, Will Gorman, Dev Millstein, Ryan Wiser. January 2023.
 """
 
-st.sidebar.image(pjm_im, width=200)
-st.sidebar.image(TRANSMISSION_IMAGE, width=200)
-st.sidebar.image(PROCESS_IMAGE, width=300,
-                 caption="fig. Interconnection Study Process")
+timing.page('PJM Heatmap')
+# sidebar images and this page's data are fetched in one parallel round
+with timing.stage('fetch'):
+    local = assets.fetch((pjm_im, TRANSMISSION_IMAGE, PROCESS_IMAGE), ('pjm_cost', 'pjm_iso', 'pjm_trans'))
+assets.image(st.sidebar, local[pjm_im], width=200)
+assets.image(st.sidebar, local[TRANSMISSION_IMAGE], width=200)
+assets.image(st.sidebar, local[PROCESS_IMAGE], width=300,
+             caption="fig. Interconnection Study Process")
 
 st.title("PJM Generator Interconnection Costs")
 st.sidebar.info(mkdwn_analysis)
@@ -57,15 +45,6 @@ st.sidebar.info(mkdwn_analysis)
 # Load data
 ###########
 
-@st.cache_data(persist=True)
-def load_pjm_cost_map_data():
-    # geodf
-    gdf = gpd.read_file(MAP_GEO)
-    # geoloc shape
-    gdf_iso = gpd.read_file(ISO_FILE)
-
-    return gdf, gdf_iso
-
 with st.expander("See summary"):
     st.subheader(
         "PJM Generator Interconnection Costs to the Transmission System")
@@ -105,7 +84,9 @@ with st.expander("See summary details"):
 def unique_no_nan(x):
     return x.dropna().unique()
 
-gdf, gdf_iso = load_pjm_cost_map_data()
+with timing.stage('load') as t:
+    gdf, gdf_iso = cost_data.load_cost_map_data('PJM')
+    t.rows = len(gdf)
 
 row1_col1, row1_col2, row1_col3, row1_col4, row1_col5 = st.columns([1, 1, 1, 1, 1])
 with row1_col1:
@@ -128,96 +109,102 @@ with row1_col3:
                                   fuel_list,index=default_ft,
                                   help = 'Filter report to show the fuel type of the project.')
 
-gdf = gdf[gdf['q_year'] == select_yr]
-gdf = gdf[gdf['fuel']==select_fuel]
-gdf = gdf[gdf['request_status'] == status_type]
-# not all of the records have cost information
-gdf = gdf[gdf['$2022_total_cost/kw']>0]
+with timing.stage('filter') as t:
+    gdf = cost_data.select('PJM', select_yr, select_fuel, status_type,
+                           ['NAME','poi_cost/kw','network_cost/kw','total_cost/kw','nameplate_mw','geometry','lon','lat'])
+    t.rows = len(gdf)
 # creating a mid point to initialize the map
-map_lat = gdf.centroid.y.mean()
-map_lon = gdf.centroid.x.mean()
-gdf = gdf[['NAME','$2022_poi_cost/kw','$2022_network_cost/kw','$2022_total_cost/kw','nameplate_mw','geometry']]
-gdf = gdf.to_crs(4326)
-gdf['lon'] = gdf.centroid.x
-gdf['lat'] = gdf.centroid.y
+map_lat = gdf['lat'].mean()
+map_lon = gdf['lon'].mean()
 
 with st.expander("See map and source code"):
     with st.echo():
-        m = leafmap.Map(center=[map_lat, map_lon],
-                        zoom_start=7,
-                        tiles="stamentoner")
-
-        m.add_heatmap(
-            gdf,
-            latitude="lat",
-            longitude="lon",
-            value="$2022_total_cost/kw",
-            name="Heat map",
-            radius=20,
-        )
-
-        g_hover_style = {"fillOpacity": 0.7}
-        g_style = {
-                "stroke": True,
-                "color": "#0000ff",
-                "weight": 2,
-                "opacity": 1,
-                "fill": True,
-                "fillColor": "#0000ff",
-                "fillOpacity": 0.1,
-                "font-family": "lato"
-                # 'fillColor': 'red' if feature['properties']['$2022_total_cost/kw'] > 150 else '#0000ff',
-                }
-
-        m.add_gdf(gdf,layer_name='Cost and Capacity',
-                  zoom_to_layer=True,
-                  info_mode='on_hover',
-                  style=g_style,
-                  hover_style=g_hover_style
-                  )
-
-        vmin = 0
-        vmax = max(gdf['$2022_total_cost/kw'])
-        colors = ['a7d661','f2e250','f58727','f52b25']
-        m.add_colorbar(colors=colors, vmin=vmin, vmax=vmax,caption='Costs in $/kW')
-
-        iso_style = {
-                "stroke": True,
-                "color": "#607fc2",
-                "weight": 2,
-                "opacity": 1,
-                "fill": True,
-                "fillColor": "##607fc2",
-                "fillOpacity": 0.1,
-                "font-family": "lato"
-                }
-        iso_hover_style = {"fillOpacity": 0.7}
-
-        m.add_geojson(ISO_FILE,
-                      layer_name="PJM area",
-                      style=iso_style,
-                      hover_style=iso_hover_style,
-                      show=False)
-
-        t_style = {
-                "stroke": True,
-                "color": "#8a8988",
-                "weight": 1,
-                "opacity": 0.5,
-                "fill": True,
-                "fillColor": "#94908b",
-                "fillOpacity": 0.1,
-                "font-family": "lato"
-                }
-        t_hover_style = {"fillOpacity": 0.5}
-        m.add_geojson(TRANS_FILE,
-                      layer_name="HV transmission",
-                      style=t_style,
-                      hover_style=t_hover_style)
-
-        plugins.MiniMap().add_to(m)
-
-m.to_streamlit(height=700)
+        def build_map(gdf, map_lat, map_lon):
+            m = leafmap.Map(center=[map_lat, map_lon],
+                            zoom_start=MAP_ZOOM,
+                            tiles="stamentoner")
+
+            if heat.enabled():
+                # density computed server side and sent as one image
+                heat.add_overlay(m, gdf, value="total_cost/kw", name="Heat map",
+                                 zoom=MAP_ZOOM, radius=20)
+            else:
+                m.add_heatmap(
+                    gdf,
+                    latitude="lat",
+                    longitude="lon",
+                    value="total_cost/kw",
+                    name="Heat map",
+                    radius=20,
+                )
+
+            g_hover_style = {"fillOpacity": 0.7}
+            g_style = {
+                    "stroke": True,
+                    "color": "#0000ff",
+                    "weight": 2,
+                    "opacity": 1,
+                    "fill": True,
+                    "fillColor": "#0000ff",
+                    "fillOpacity": 0.1,
+                    "font-family": "lato"
+                    # 'fillColor': 'red' if feature['properties']['total_cost/kw'] > 150 else '#0000ff',
+                    }
+
+            m.add_gdf(gdf,layer_name='Cost and Capacity',
+                      zoom_to_layer=True,
+                      info_mode='on_hover',
+                      style=g_style,
+                      hover_style=g_hover_style
+                      )
+
+            vmin = 0
+            vmax = max(gdf['total_cost/kw'])
+            colors = ['a7d661','f2e250','f58727','f52b25']
+            m.add_colorbar(colors=colors, vmin=vmin, vmax=vmax,caption='Costs in $/kW')
+
+            iso_style = {
+                    "stroke": True,
+                    "color": "#607fc2",
+                    "weight": 2,
+                    "opacity": 1,
+                    "fill": True,
+                    "fillColor": "##607fc2",
+                    "fillOpacity": 0.1,
+                    "font-family": "lato"
+                    }
+            iso_hover_style = {"fillOpacity": 0.7}
+
+            tiles.add_layer(m, 'pjm_iso', "PJM area", MAP_ZOOM,
+                            style=iso_style,
+                            hover_style=iso_hover_style,
+                            show=False)
+
+            t_style = {
+                    "stroke": True,
+                    "color": "#8a8988",
+                    "weight": 1,
+                    "opacity": 0.5,
+                    "fill": True,
+                    "fillColor": "#94908b",
+                    "fillOpacity": 0.1,
+                    "font-family": "lato"
+                    }
+            t_hover_style = {"fillOpacity": 0.5}
+            tiles.add_layer(m, 'pjm_trans', "HV transmission", MAP_ZOOM,
+                            style=t_style,
+                            hover_style=t_hover_style)
+
+            plugins.MiniMap().add_to(m)
+            return m
+
+# the finished map is shared across sessions, one entry per data version and filter tuple
+with timing.stage('map_html') as t:
+    html = render.map_html(('PJM', cost_data.data_version('PJM'), select_yr, select_fuel, status_type),
+                           lambda: build_map(gdf, map_lat, map_lon))
+    t.nbytes = len(html)
+with timing.stage('show_map', nbytes=len(html)):
+    render.show_map(html, height=700)
 
 ###########
 # Display raw data
@@ -225,32 +212,17 @@ m.to_streamlit(height=700)
 
 if st.checkbox("Show Raw Cost Data from Map",False,help = 'Displays the raw data based on filters.'):
       st.subheader('Raw Cost Data')
-      raw_gdf = gdf[['NAME','nameplate_mw','$2022_poi_cost/kw','$2022_network_cost/kw','$2022_total_cost/kw']]
+      raw_gdf = gdf[['NAME','nameplate_mw','poi_cost/kw','network_cost/kw','total_cost/kw']]
       raw_gdf.rename({'NAME':'County name','nameplate_mw':'Capacity (MW)'},axis=1,inplace=True)
       st.write(raw_gdf)
 
 ###########
 # Boxplot chart
 ###########
-chart_df = pd.DataFrame(gdf)
-arr = chart_df[['$2022_poi_cost/kw','$2022_network_cost/kw','$2022_total_cost/kw']]
-columns = arr.columns.values.tolist()
-fig, ax = plt.subplots()
-
-ax.set(
-# title='Cost distribution',
-ylabel='Costs per kW',
-# xlabel='Types of Costs'
-)
-
-ax.yaxis.grid(True, linestyle='-', which='major', color='lightgrey',
-               alpha=0.5)
-
-ax.boxplot(arr,sym='+',vert=True,whis=1.5,notch=False)
-
-ax.set_xticklabels(columns)
-
-st.pyplot(fig)
+with timing.stage('boxplot') as t:
+    stats, outliers = cost_data.box_stats('PJM', select_yr, select_fuel, status_type)
+    st.altair_chart(charts.box_chart(stats, outliers), theme="streamlit", use_container_width=True)
+    t.rows = int(stats['n'].sum())
 
 ###########
 # Cost growth chart
@@ -285,4 +257,4 @@ with st.expander("See service type notes"):
     st.markdown('- Energy service permits participation in the energy market and largely uses the existing transmission system on an as available basis. The **vast majority (95%)** of all projects studied between 2017 and 2022 chose **capacity** as service type, a substantial increase over earlier years.')
     st.markdown('- Capacity status for wind offshore: 100%, solar: 99%,  wind  onshore: 98%. The  exception  of  solar  hybrid  projects (76%). Natural gas (95%) and storage (92%) stand-alone installations have slightly lower rates.')
 
-
+timing.panel()
@@ -1,14 +1,12 @@
 
-import pandas as pd
-import geopandas as gpd
 import streamlit as st
 import leafmap.foliumap as leafmap
 from folium import plugins
-import matplotlib.pyplot as plt
-import matplotlib.style as style
+
+from common import assets, charts, cost_data, heat, render, tiles, timing
 
 st.set_page_config(page_title="MISO Costs ⚡",
-                   page_icon='https://i.imgur.com/UbOXYAU.png',
+                   page_icon=assets.bundled('https://i.imgur.com/UbOXYAU.png'),
                    layout="wide")
 
 # add transmission map
@@ -16,30 +14,21 @@ st.set_page_config(page_title="MISO Costs ⚡",
 PROCESS_IMAGE = 'https://github.com/kman2022/data/blob/main/main/berkley/IQ_study_process_small%20copy.png?raw=true'
 TRANSMISSION_IMAGE = 'https://github.com/kman2022/data/blob/main/main/berkley/transmission.png?raw=true'
 miso_im = 'https://www.misoenergy.org/client/dist/img/logo.png'
-MAP_GEO = "https://github.com/kman2022/data/blob/main/main/berkley/gdp_cost_miso_qeo.geojson?raw=true"
-ISO_FILE = 'https://github.com/kman2022/data/blob/main/main/berkley/miso.geojson?raw=true'
 TRANS_FILE = 'https://github.com/kman2022/data/blob/main/main/berkley/miso_transmission_short.geojson?raw=true'
-
-style.use('fivethirtyeight')
-plt.rcParams['lines.linewidth'] = 1
-dpi = 1000
-plt.rcParams['font.size'] = 13
-plt.rcParams['font.family'] = 'Lato'
-plt.rcParams['axes.labelsize'] = plt.rcParams['font.size']
-plt.rcParams['axes.titlesize'] = plt.rcParams['font.size']
-plt.rcParams['legend.fontsize'] = plt.rcParams['font.size']
-plt.rcParams['xtick.labelsize'] = plt.rcParams['font.size']
-plt.rcParams['ytick.labelsize'] = plt.rcParams['font.size']
-plt.rcParams['figure.figsize'] = 8, 8
+MAP_ZOOM = 7
 
 mkdwn_analysis = """
     **Source:** [Generator Interconnection Costs to the Transmission System:](https://emp.lbl.gov/interconnection_costs) Seel, Joachim, Joseph Rand, Will Gorman, Dev Millstein, Ryan H Wiser, Will Cotton, Nicholas DiSanti, and Kevin Porter. "Generator Interconnection Cost Analysis in the Midcontinent Independent System Operator (MISO) territory." Oct-2022 (data thru 2021).
 """
 
-st.sidebar.image(miso_im, width=200)
-st.sidebar.image(TRANSMISSION_IMAGE, width=200)
-st.sidebar.image(PROCESS_IMAGE, width=300,
-                 caption="fig. Interconnection Study Process")
+timing.page('MISO Heatmap')
+# sidebar images and this page's data are fetched in one parallel round
+with timing.stage('fetch'):
+    local = assets.fetch((miso_im, TRANSMISSION_IMAGE, PROCESS_IMAGE), ('miso_cost', 'miso_iso'))
+assets.image(st.sidebar, local[miso_im], width=200)
+assets.image(st.sidebar, local[TRANSMISSION_IMAGE], width=200)
+assets.image(st.sidebar, local[PROCESS_IMAGE], width=300,
+             caption="fig. Interconnection Study Process")
 st.sidebar.info(mkdwn_analysis)
 st.title("MISO Generator Interconnection Costs")
 
@@ -47,14 +36,6 @@ st.title("MISO Generator Interconnection Costs")
 # Load data
 ###########
 
-@st.cache_data(persist=True)
-def load_cost_map_data():
-    # geodf
-    gdf = gpd.read_file(MAP_GEO)
-    # geoloc shape
-    gdf_iso = gpd.read_file(ISO_FILE)
-    return gdf, gdf_iso
-
 with st.expander("See summary"):
     st.subheader(
         "MISO Generator Interconnection Costs to the Transmission System")
@@ -93,7 +74,9 @@ with st.expander("See summary details"):
 def unique_no_nan(x):
     return x.dropna().unique()
 
-gdf, gdf_iso = load_cost_map_data()
+with timing.stage('load') as t:
+    gdf, gdf_iso = cost_data.load_cost_map_data('MISO')
+    t.rows = len(gdf)
 
 row1_col1, row1_col2, row1_col3, row1_col4, row1_col5 = st.columns([1, 1, 1, 1, 1])
 with row1_col1:
@@ -116,96 +99,102 @@ with row1_col3:
                                   fuel_list,index=default_ft,
                                   help = 'Filter report to show the fuel type of the project.')
 
-gdf = gdf[gdf['q_year'] == select_yr]
-gdf = gdf[gdf['fuel']==select_fuel]
-gdf = gdf[gdf['request_status'] == status_type]
-# not all of the records have cost information
-gdf = gdf[gdf['real_total/kw']>0]
+with timing.stage('filter') as t:
+    gdf = cost_data.select('MISO', select_yr, select_fuel, status_type,
+                           ['NAME','poi_cost/kw','network_cost/kw','total_cost/kw','nameplate_mw','geometry','lon','lat'])
+    t.rows = len(gdf)
 # creating a mid point to initialize the map
-cmap_lat = gdf.centroid.y.mean()
-cmap_lon = gdf.centroid.x.mean()
-gdf = gdf[['NAME','real_poi/kw','real_network/kw','real_total/kw','nameplate_mw','geometry']]
-gdf = gdf.to_crs(4326)
-gdf['lon'] = gdf.centroid.x
-gdf['lat'] = gdf.centroid.y
+cmap_lat = gdf['lat'].mean()
+cmap_lon = gdf['lon'].mean()
 
 with st.expander("See map and source code"):
     with st.echo():
-        
-        cm = leafmap.Map(center=[cmap_lat, cmap_lon],
-                        zoom_start=7,
-                        tiles="stamentoner")
-
-        cm.add_heatmap(
-            gdf,
-            latitude="lat",
-            longitude="lon",
-            value="real_total/kw",
-            name="Heat map",
-            radius=20,
-        )
-
-        g_hover_style = {"fillOpacity": 0.7}
-        g_style = {
-                "stroke": True,
-                "color": "#0000ff",
-                "weight": 2,
-                "opacity": 1,
-                "fill": True,
-                "fillColor": "#0000ff",
-                "fillOpacity": 0.1,
-                "font-family": "lato"
-                }
-
-        cm.add_gdf(gdf,layer_name='Cost and Capacity',
-                  zoom_to_layer=True,
-                  info_mode='on_hover',
-                  style=g_style,
-                  hover_style=g_hover_style
-                  )
-
-        vmin = 0
-        vmax = max(gdf['real_total/kw'])
-        colors = ['a7d661','f2e250','f58727','f52b25']
-        cm.add_colorbar(colors=colors, vmin=vmin, vmax=vmax,caption='Costs in $/kW')
-
-        iso_style = {
-                "stroke": True,
-                "color": "#607fc2",
-                "weight": 2,
-                "opacity": 1,
-                "fill": True,
-                "fillColor": "##607fc2",
-                "fillOpacity": 0.1,
-                "font-family": "lato"
-                }
-        iso_hover_style = {"fillOpacity": 0.7}
-
-        cm.add_geojson(ISO_FILE,
-                      layer_name="MISO area",
-                      style=iso_style,
-                      hover_style=iso_hover_style,
-                      show=False)
-
-        # t_style = {
-        #         "stroke": True,
-        #         "color": "#8a8988",
-        #         "weight": 1,
-        #         "opacity": 0.5,
-        #         "fill": True,
-        #         "fillColor": "#94908b",
-        #         "fillOpacity": 0.1,
-        #         "font-family": "lato"
-        #         }
-        # t_hover_style = {"fillOpacity": 0.5}
-        # m.add_geojson(TRANS_FILE,
-        #               layer_name="HV transmission",
-        #               style=t_style,
-        #               hover_style=t_hover_style)
-
-        plugins.MiniMap().add_to(cm)
-        
-cm.to_streamlit(height=700)
+        def build_map(gdf, cmap_lat, cmap_lon):
+            cm = leafmap.Map(center=[cmap_lat, cmap_lon],
+                            zoom_start=MAP_ZOOM,
+                            tiles="stamentoner")
+
+            if heat.enabled():
+                # density computed server side and sent as one image
+                heat.add_overlay(cm, gdf, value="total_cost/kw", name="Heat map",
+                                 zoom=MAP_ZOOM, radius=20)
+            else:
+                cm.add_heatmap(
+                    gdf,
+                    latitude="lat",
+                    longitude="lon",
+                    value="total_cost/kw",
+                    name="Heat map",
+                    radius=20,
+                )
+
+            g_hover_style = {"fillOpacity": 0.7}
+            g_style = {
+                    "stroke": True,
+                    "color": "#0000ff",
+                    "weight": 2,
+                    "opacity": 1,
+                    "fill": True,
+                    "fillColor": "#0000ff",
+                    "fillOpacity": 0.1,
+                    "font-family": "lato"
+                    }
+
+            cm.add_gdf(gdf,layer_name='Cost and Capacity',
+                      zoom_to_layer=True,
+                      info_mode='on_hover',
+                      style=g_style,
+                      hover_style=g_hover_style
+                      )
+
+            vmin = 0
+            vmax = max(gdf['total_cost/kw'])
+            colors = ['a7d661','f2e250','f58727','f52b25']
+            cm.add_colorbar(colors=colors, vmin=vmin, vmax=vmax,caption='Costs in $/kW')
+
+            iso_style = {
+                    "stroke": True,
+                    "color": "#607fc2",
+                    "weight": 2,
+                    "opacity": 1,
+                    "fill": True,
+                    "fillColor": "##607fc2",
+                    "fillOpacity": 0.1,
+                    "font-family": "lato"
+                    }
+            iso_hover_style = {"fillOpacity": 0.7}
+
+            tiles.add_layer(cm, 'miso_iso', "MISO area", MAP_ZOOM,
+                            style=iso_style,
+                            hover_style=iso_hover_style,
+                            show=False)
+
+            # t_style = {
+            #         "stroke": True,
+            #         "color": "#8a8988",
+            #         "weight": 1,
+            #         "opacity": 0.5,
+            #         "fill": True,
+            #         "fillColor": "#94908b",
+            #         "fillOpacity": 0.1,
+            #         "font-family": "lato"
+            #         }
+            # t_hover_style = {"fillOpacity": 0.5}
+            # m.add_geojson(TRANS_FILE,
+            #               layer_name="HV transmission",
+            #               style=t_style,
+            #               hover_style=t_hover_style)
+
+            plugins.MiniMap().add_to(cm)
+            return cm
+
+# the finished map is shared across sessions, one entry per data version and filter tuple
+with timing.stage('map_html') as t:
+    html = render.map_html(('MISO', cost_data.data_version('MISO'), select_yr, select_fuel, status_type),
+                           lambda: build_map(gdf, cmap_lat, cmap_lon))
+    t.nbytes = len(html)
+with timing.stage('show_map', nbytes=len(html)):
+    render.show_map(html, height=700)
 
 ###########
 # Display raw data
@@ -213,32 +202,17 @@ cm.to_streamlit(height=700)
 
 if st.checkbox("Show Raw Cost Data from Map",False,help = 'Displays the raw data based on filters.'):
       st.subheader('Raw Cost Data')
-      raw_gdf = gdf[['NAME','nameplate_mw','real_poi/kw','real_network/kw','real_total/kw']]
+      raw_gdf = gdf[['NAME','nameplate_mw','poi_cost/kw','network_cost/kw','total_cost/kw']]
       raw_gdf.rename({'NAME':'County name','nameplate_mw':'Capacity (MW)'},axis=1,inplace=True)
       st.write(raw_gdf)
 
 ###########
 # Boxplot chart
 ###########
-chart_df = pd.DataFrame(gdf)
-arr = chart_df[['real_poi/kw','real_network/kw','real_total/kw']]
-columns = arr.columns.values.tolist()
-fig, ax = plt.subplots()
-
-ax.set(
-# title='Cost distribution',
-ylabel='Costs per kW',
-# xlabel='Types of Costs'
-)
-
-ax.yaxis.grid(True, linestyle='-', which='major', color='lightgrey',
-               alpha=0.5)
-
-ax.boxplot(arr,sym='+',vert=True,whis=1.5,notch=False)
-
-ax.set_xticklabels(columns)
-
-st.pyplot(fig)
+with timing.stage('boxplot') as t:
+    stats, outliers = cost_data.box_stats('MISO', select_yr, select_fuel, status_type)
+    st.altair_chart(charts.box_chart(stats, outliers), theme="streamlit", use_container_width=True)
+    t.rows = int(stats['n'].sum())
 
 ###########
 # Cost growth chart
@@ -270,3 +244,5 @@ with st.expander("See service type notes"):
     st.markdown('- Capacity status reserves transmission capacity for the output of the generator during high load hours, for example allowing the project owner to have deliverable capacity that it can bid into resource adequacy markets. While  capacity resources may still be curtailed during emergency events, they are treated preferentially in comparison to energy resources. This privilege comes with  a  cost  however, as the generator may need to pay for additional transmission network upgrades.')
     st.markdown('- MISO should consider reducing the ERIS distribution factor cutoff in Generator Interconnection Definitive Planning Phase (DPP) studies from 20% to 10% to better mitigate overloaded facilities')
     st.markdown('- For MISO, ERIS will not be considered unless they have a confirmed firm transmission service reservation associated with the generator.')
+
+timing.panel()
@@ -14,5 +14,13 @@ echo "\
 headless = true\n\
 port = $PORT\n\
 enableCORS = false\n\
+enableStaticServing = true\n\
 \n\
-" > ~/.streamlit/config.toml
\ No newline at end of file
+" > ~/.streamlit/config.toml
+
+# fill the local data store before the server takes traffic
+python build_data.py warmup
+python build_data.py assets || echo "assets: not vendored, images stay hot-linked"
+# the bundle's cache headers come from tornado's static handler (see requirements.txt)
+python -c "import streamlit.web.server.app_static_file_handler" 2>/dev/null \
+    || echo "assets: this streamlit serves app/static without Cache-Control; set it in the proxy"
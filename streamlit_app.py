@@ -1,5 +1,7 @@
 import streamlit as st
 
+from common import assets
+
 UC_IMAGE = '🔌'
 PWR_IMAGE = 'https://raw.githubusercontent.com/kman2022/data/main/main/berkley/power_pic.jpeg'
 PROCESS_IMAGE ='https://github.com/kman2022/data/blob/main/main/berkley/IQ_study_process_small%20copy.png?raw=true'
@@ -31,11 +33,11 @@ st.sidebar.title("About")
 
 st.sidebar.info(src_markdown)
 b_logo = "https://emp.lbl.gov/sites/all/files/logo.png"
-st.sidebar.image(b_logo)
+assets.image(st.sidebar, assets.bundled(b_logo))
 
 st.sidebar.info(ferc_markdown)
 f_logo = "https://elibrary.ferc.gov/eLibrary/assets/img/FERC-banner.png"
-st.sidebar.image(f_logo,width=75)
+assets.image(st.sidebar, assets.bundled(f_logo), width=75)
 
 st.title("Berkley Labs Data")
 st.markdown(
@@ -44,7 +46,7 @@ st.markdown(
     """
 )
 
-st.image(PWR_IMAGE,width=350)
+assets.image(st, assets.bundled(PWR_IMAGE), width=350)
 st.header("Instructions")
 instructions = """
 1. For the [GitHub repository](https://github.com/kman2022/streamlit-multipage-template), [data](https://github.com/kman2022/data/tree/main/main/berkley).
@@ -52,7 +54,7 @@ instructions = """
 3. Scrapes have been built to interconnection queue data and this and other data can be added.
 """
 st.markdown(instructions)
-st.image(PROCESS_IMAGE,caption='Note: detailed steps (Interconnection Studies) were not included')
+assets.image(st, assets.bundled(PROCESS_IMAGE), caption='Note: detailed steps (Interconnection Studies) were not included')
 
 st.markdown('------')
 st.header('[FERC 845](https://elibrary.ferc.gov/eLibrary/docinfo?accession_Number=20190221-3075)')